@@ -1,76 +1,216 @@
 """Main Telegram bot file for fitness trainer sales system."""
 import asyncio
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 from loguru import logger
-from config import TELEGRAM_BOT_TOKEN, LOG_LEVEL
+from sqlalchemy import select, update
+from config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, REDIS_URL
+from database.db import AsyncSessionLocal, get_db_session
+from database.models import Client
+from database.models_crm import Reminder
 from handlers import start, questionnaire, payment, contacts, faq, admin, admin_payment, my_programs, progress_journal, recommendations
+from services.marketing_service import MarketingService
+from services.payment_service import PaymentService
+from services.reminder_service import ReminderService, send_reminder_via_bot, due_reminders_query
+from services.social_scheduler import SocialScheduler
 
-# Configure logging
-logger.add("logs/bot.log", rotation="10 MB", level=LOG_LEVEL)
+# Configure logging: sinks write from a background thread (enqueue=True),
+# so console/file I/O during error bursts does not block the event loop
+logger.remove()
+logger.add(sys.stderr, level="DEBUG", enqueue=True)
+logger.add("logs/bot.log", rotation="10 MB", level=LOG_LEVEL, enqueue=True)
 
+# Handler routers in registration order (order matters for overlapping filters)
+ROUTERS = (
+    start.router,
+    questionnaire.router,
+    payment.router,
+    contacts.router,
+    faq.router,
+    recommendations.router,
+    my_programs.router,
+    progress_journal.router,
+    admin.router,
+    admin_payment.router,
+)
 
-async def process_reminders_periodically(bot: Bot):
+# Commands shown in the Telegram menu
+BOT_COMMANDS = (
+    BotCommand(command="start", description="Главное меню"),
+    BotCommand(command="program", description="Получить программу тренировок"),
+    BotCommand(command="my_programs", description="Мои программы"),
+    BotCommand(command="progress", description="Дневник параметров"),
+    BotCommand(command="price", description="Узнать цены"),
+    BotCommand(command="contacts", description="Контакты тренера"),
+    BotCommand(command="faq", description="Часто задаваемые вопросы"),
+    BotCommand(command="recommend", description="Персональные рекомендации"),
+)
+
+# Max reminder messages in flight at once (Telegram allows ~30 msg/s per bot)
+REMINDER_SEND_CONCURRENCY = 20
+
+# Redis lock so that only one bot replica runs the reminder ticker at a time
+REMINDER_LOCK_NAME = "fitcrm:lock:reminders"
+
+# Strong references to periodic tasks: the event loop keeps only weak ones,
+# so an unreferenced task can be garbage-collected mid-run
+BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+def start_background_task(coro) -> asyncio.Task:
+    """Schedule a long-lived coroutine and keep it referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+
+def create_fsm_storage():
+    """
+    FSM storage for the dispatcher: Redis when REDIS_URL is set (state survives
+    restarts and is shared between replicas), process memory otherwise.
+
+    Returns (storage, redis client or None).
+    """
+    if not REDIS_URL:
+        return MemoryStorage(), None
+    from redis.asyncio import Redis
+    from aiogram.fsm.storage.redis import RedisStorage
+    redis = Redis.from_url(REDIS_URL)
+    return RedisStorage(redis), redis
+
+
+@asynccontextmanager
+async def replica_lock(redis, name: str, ttl: float):
+    """
+    Try to take a non-blocking Redis lock for one run of a periodic job.
+
+    Yields True if this replica should do the work (always True without Redis).
+    The lock expires after `ttl` seconds, so a crashed replica cannot hold it forever.
+    """
+    if redis is None:
+        yield True
+        return
+    from redis.exceptions import LockError
+    lock = redis.lock(name, timeout=ttl, blocking=False)
+    acquired = await lock.acquire()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                await lock.release()
+            except LockError:
+                logger.warning(f"Lock {name} expired before the job finished")
+
+
+async def wait_next_tick(deadline: float, interval: float, name: str) -> float:
+    """
+    Sleep until `deadline` (event loop monotonic clock) and return the following one.
+
+    The period is measured start-to-start, so it does not drift with the time the
+    work takes. If the work overran one or more slots, skip to the next aligned
+    slot instead of firing back-to-back.
+    """
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    if deadline < now:
+        missed = int((now - deadline) // interval) + 1
+        logger.warning(f"{name}: iteration overran by {missed} interval(s), skipping to next slot")
+        deadline += missed * interval
+    await asyncio.sleep(deadline - loop.time())
+    return deadline + interval
+
+
+async def process_reminders_periodically(bot: Bot, redis=None):
     """
     Периодически обрабатывать напоминания.
-    Запускается каждые 30 минут.
+    Запускается каждые 30 минут; при нескольких репликах бота
+    тик выполняет только та, что взяла блокировку в Redis.
     """
-    from services.reminder_service import ReminderService, send_reminder_via_bot
-    from database.db import get_db_session
-    from database.models import Client
-    
+    interval = 30 * 60  # 30 минут
+    deadline = asyncio.get_running_loop().time() + interval
     while True:
+        deadline = await wait_next_tick(deadline, interval, "reminders")
         try:
-            await asyncio.sleep(30 * 60)  # 30 минут
-            
-            logger.info("Processing reminders...")
-            reminders = ReminderService.get_due_reminders(limit=100)
-            
-            if not reminders:
-                logger.info("No due reminders")
-                continue
-            
-            logger.info(f"Found {len(reminders)} due reminders")
-            
-            processed = 0
-            for reminder in reminders:
-                try:
-                    db = get_db_session()
-                    client = db.query(Client).filter(Client.id == reminder.client_id).first()
+            async with replica_lock(redis, REMINDER_LOCK_NAME, interval) as acquired:
+                if not acquired:
+                    logger.info("Reminders are being processed by another replica, skipping")
+                    continue
+                
+                logger.info("Processing reminders...")
+                processed = 0
+                # One pooled async session and transaction per batch
+                async with AsyncSessionLocal() as db, db.begin():
+                    reminders = (await db.scalars(due_reminders_query(limit=100))).all()
                     
-                    # Check if client has Telegram ID (positive = has Telegram account)
-                    if not client or client.telegram_id <= 0:
-                        logger.info(f"Client {reminder.client_id} doesn't have Telegram account, marking reminder as sent")
-                        ReminderService.mark_reminder_sent(reminder.id)
-                        db.close()
+                    if not reminders:
+                        logger.info("No due reminders")
                         continue
                     
-                    # Process reminder (updates pipeline, creates actions)
-                    success = ReminderService.process_reminder(reminder)
+                    logger.info(f"Found {len(reminders)} due reminders")
                     
-                    if success:
-                        # Send message via bot if client has Telegram
-                        sent = await send_reminder_via_bot(reminder, bot)
-                        if sent:
-                            ReminderService.mark_reminder_sent(reminder.id)
+                    # One query for all clients of the batch instead of one per reminder
+                    client_ids = {reminder.client_id for reminder in reminders}
+                    clients_by_id = {
+                        client.id: client
+                        for client in await db.scalars(select(Client).where(Client.id.in_(client_ids)))
+                    }
+                    
+                    done_ids = []
+                    to_send = []
+                    for reminder in reminders:
+                        try:
+                            client = clients_by_id.get(reminder.client_id)
+                            
+                            # Check if client has Telegram ID (positive = has Telegram account)
+                            if not client or client.telegram_id <= 0:
+                                logger.info(f"Client {reminder.client_id} doesn't have Telegram account, marking reminder as sent")
+                                done_ids.append(reminder.id)
+                                continue
+                            
+                            # Process reminder (updates pipeline, creates actions); it uses the
+                            # sync session, so keep it off the event loop
+                            if await asyncio.to_thread(ReminderService.process_reminder, reminder):
+                                to_send.append((reminder, client))
+                                
+                        except Exception:
+                            logger.exception(f"Error processing reminder {reminder.id}")
+                    
+                    # Send messages concurrently, bounded to stay under Telegram rate limits
+                    semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+                    
+                    async def send_one(reminder, client) -> bool:
+                        async with semaphore:
+                            return await send_reminder_via_bot(reminder, bot, client=client)
+                    
+                    results = await asyncio.gather(
+                        *(send_one(reminder, client) for reminder, client in to_send),
+                        return_exceptions=True,
+                    )
+                    for (reminder, _), sent in zip(to_send, results):
+                        if isinstance(sent, BaseException):
+                            logger.opt(exception=sent).error(f"Error sending reminder {reminder.id}")
+                        elif sent:
+                            done_ids.append(reminder.id)
                             processed += 1
                             logger.info(f"Processed and sent reminder {reminder.id} for client {reminder.client_id}")
                     
-                    db.close()
-                        
-                except Exception as e:
-                    logger.error(f"Error processing reminder {reminder.id}: {e}")
-                    import traceback
-                    traceback.print_exc()
-            
-            logger.info(f"Processed {processed} reminders")
-            
-        except Exception as e:
-            logger.error(f"Error in process_reminders_periodically: {e}")
-            import traceback
-            traceback.print_exc()
-            await asyncio.sleep(60)  # Wait 1 minute before retrying
+                    if done_ids:
+                        await db.execute(
+                            update(Reminder)
+                            .where(Reminder.id.in_(done_ids))
+                            .values(is_sent=True, sent_at=datetime.utcnow())
+                        )
+                
+                logger.info(f"Processed {processed} reminders")
+                
+        except Exception:
+            logger.exception("Error in process_reminders_periodically")
 
 
 async def check_payments_periodically():
@@ -78,71 +218,50 @@ async def check_payments_periodically():
     Периодически проверять статус платежей.
     Запускается каждые 5 минут.
     """
-    from services.payment_service import PaymentService
-    
+    interval = 5 * 60  # 5 минут
+    deadline = asyncio.get_running_loop().time() + interval
     while True:
+        deadline = await wait_next_tick(deadline, interval, "payments")
         try:
-            await asyncio.sleep(5 * 60)  # 5 минут
-            
             logger.info("Checking pending payments...")
             updated_count = await PaymentService.check_pending_payments_async(limit=100)
             
             if updated_count > 0:
                 logger.info(f"Updated {updated_count} payment statuses")
             
-        except Exception as e:
-            logger.error(f"Error in check_payments_periodically: {e}")
-            import traceback
-            traceback.print_exc()
-            await asyncio.sleep(60)  # Wait 1 minute before retrying
+        except Exception:
+            logger.exception("Error in check_payments_periodically")
 
 
 async def main():
     """Main function to run the bot."""
     # Initialize bot and dispatcher
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    storage, redis = create_fsm_storage()
+    dp = Dispatcher(storage=storage)
 
     # Register routers
-    dp.include_router(start.router)
-    dp.include_router(questionnaire.router)
-    dp.include_router(payment.router)
-    dp.include_router(contacts.router)
-    dp.include_router(faq.router)
-    dp.include_router(recommendations.router)
-    dp.include_router(my_programs.router)
-    dp.include_router(progress_journal.router)
-    dp.include_router(admin.router)
-    dp.include_router(admin_payment.router)
+    for router in ROUTERS:
+        dp.include_router(router)
 
     # Set bot commands
-    commands = [
-        BotCommand(command="start", description="Главное меню"),
-        BotCommand(command="program", description="Получить программу тренировок"),
-        BotCommand(command="my_programs", description="Мои программы"),
-        BotCommand(command="progress", description="Дневник параметров"),
-        BotCommand(command="price", description="Узнать цены"),
-        BotCommand(command="contacts", description="Контакты тренера"),
-        BotCommand(command="faq", description="Часто задаваемые вопросы"),
-        BotCommand(command="recommend", description="Персональные рекомендации"),
-    ]
-    await bot.set_my_commands(commands)
+    await bot.set_my_commands(list(BOT_COMMANDS))
 
     logger.info("Bot started successfully!")
     
     # Start reminder processing task
-    asyncio.create_task(process_reminders_periodically(bot))
+    start_background_task(process_reminders_periodically(bot, redis))
     
     # Start payment status checking task
-    asyncio.create_task(check_payments_periodically())
+    start_background_task(check_payments_periodically())
     
     # Start marketing scheduled processing every 15 minutes
     async def process_marketing_periodically():
-        from database.db import get_db_session
-        from services.marketing_service import MarketingService
+        interval = 15 * 60
+        deadline = asyncio.get_running_loop().time() + interval
         while True:
+            deadline = await wait_next_tick(deadline, interval, "marketing")
             try:
-                await asyncio.sleep(15 * 60)
                 db = get_db_session()
                 started = MarketingService.process_scheduled(db, limit_per_run=200, max_runs=3)
                 logger.info(f"Marketing scheduled runs started: {started}")
@@ -150,14 +269,14 @@ async def main():
             except Exception as e:
                 logger.error(f"Marketing periodic error: {e}")
 
-    asyncio.create_task(process_marketing_periodically())
+    start_background_task(process_marketing_periodically())
 
     async def process_social_posts_periodically():
-        from database.db import get_db_session
-        from services.social_scheduler import SocialScheduler
+        interval = 10 * 60
+        deadline = asyncio.get_running_loop().time() + interval
         while True:
+            deadline = await wait_next_tick(deadline, interval, "social posts")
             try:
-                await asyncio.sleep(10 * 60)
                 db = get_db_session()
                 processed = SocialScheduler.process_scheduled(db, limit=5)
                 if processed:
@@ -166,10 +285,13 @@ async def main():
             except Exception as e:
                 logger.error(f"Social posts periodic error: {e}")
 
-    asyncio.create_task(process_social_posts_periodically())
+    start_background_task(process_social_posts_periodically())
 
     # Start polling
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await storage.close()
 
 
 if __name__ == "__main__":
@@ -177,4 +299,11 @@ if __name__ == "__main__":
     import os
     os.makedirs("logs", exist_ok=True)
     
+    # libuv-based event loop where available (not supported on Windows)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.info("uvloop is not installed, using the default asyncio event loop")
+    
     asyncio.run(main())
@@ -23,6 +23,9 @@ VK_GROUP_ID = os.getenv("VK_GROUP_ID")  # numeric ID or screen name, e.g. -12345
 # Database Configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
 
+# Redis (optional): bot FSM storage and locks between bot replicas
+REDIS_URL = os.getenv("REDIS_URL")
+
 # Google Sheets Configuration
 # Google Sheets - using public CSV access (no credentials needed)
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")  # Optional, extracted from URL automatically
@@ -82,6 +85,11 @@ PRICE_CONSULTATION = int(os.getenv("PRICE_CONSULTATION", "1490"))
 PRICE_ONLINE_1_MONTH = int(os.getenv("PRICE_ONLINE_1_MONTH", "14999"))
 PRICE_ONLINE_3_MONTHS = int(os.getenv("PRICE_ONLINE_3_MONTHS", "34999"))
 
+# CRM API authentication
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+# Cost factor for new bcrypt password hashes; older hashes are re-hashed on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 # Bot Settings
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -1,40 +1,123 @@
 """Dependencies for FastAPI routes."""
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+import jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from sqlalchemy import bindparam, event, select
 from database.db import get_db_session
 from sqlalchemy.orm import Session
 from database.models_crm import User
+from config import JWT_SECRET_KEY
 from loguru import logger
+import hashlib
+import threading
+import time
 
 # JWT settings
-SECRET_KEY = "your-secret-key-change-in-production"  # TODO: Move to config
+SECRET_KEY = JWT_SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
+ACCESS_TOKEN_TTL = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+
+# Prepared once at import instead of on every encode/decode
+_JWT_KEY = SECRET_KEY.encode("utf-8")
+_JWT_ALGORITHMS = [ALGORITHM]
+_jwt_codec = jwt.PyJWT()
+
+# Auth caches: verified tokens (digest -> user id, expiry) and recently loaded active users
+TOKEN_CACHE_SIZE = 4096
+USER_CACHE_SIZE = 2048
+USER_CACHE_TTL_SECONDS = 30
 
 security = HTTPBearer()
 
+# Built once so every request reuses the same statement (and its compiled SQL)
+_SELECT_USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+_SELECT_USER_IS_ACTIVE = select(User.is_active).where(User.id == bindparam("user_id"))
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db_session)
-) -> User:
-    """Get current authenticated user from JWT token."""
-    token = credentials.credentials
-    
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
+_token_cache: dict[bytes, tuple[int, Optional[float]]] = {}
+_token_cache_lock = threading.Lock()
+_user_cache: dict[int, tuple[float, User]] = {}
+_user_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> bytes:
+    # A short digest instead of the raw token: smaller keys, and no bearer tokens kept in memory
+    return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+
+def _resolve_token(token: str) -> tuple[int, Optional[float]]:
+    """Return (user_id, exp) for a token, verifying its signature once per distinct token.
+
+    `exp` is re-checked by the caller, since a cached token may have expired since.
+    """
+    key = _token_key(token)
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+    if entry is not None:
+        return entry
+
+    payload = _jwt_codec.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
+    user_id = payload.get("sub")
+    if user_id is None:
+        logger.warning("Token payload missing 'sub' field")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+    entry = (int(user_id), payload.get("exp"))  # Ensure it's an integer
+
+    with _token_cache_lock:
+        if len(_token_cache) >= TOKEN_CACHE_SIZE:
+            _token_cache.clear()
+        _token_cache[key] = entry
+    return entry
+
+
+def _get_cached_user(user_id: int) -> Optional[User]:
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _user_cache[user_id]
+            return None
+        return user
+
+
+def _cache_user(user: User) -> None:
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_SIZE:
+            _user_cache.clear()
+        _user_cache[user.id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+
+
+def invalidate_user_cache(user_id: Optional[int] = None) -> None:
+    """Drop cached user(s) so the next request reloads them from the database."""
+    with _user_cache_lock:
         if user_id is None:
-            logger.warning("Token payload missing 'sub' field")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-        user_id = int(user_id)  # Ensure it's an integer
-    except JWTError as e:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_changed(mapper, connection, target: User) -> None:
+    invalidate_user_cache(target.id)
+
+
+def _authenticate_token(token: str) -> int:
+    """Validate a bearer token and return its user id (401 on any token problem)."""
+    try:
+        user_id, exp = _resolve_token(token)
+        if exp is not None and exp <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+    except HTTPException:
+        raise
+    except jwt.PyJWTError as e:
         logger.warning(f"JWT decode error: {e}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,8 +129,21 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
+    return user_id
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db_session)
+) -> User:
+    """Get current authenticated user from JWT token."""
+    user_id = _authenticate_token(credentials.credentials)
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = _get_cached_user(user_id)
+    if user is not None:
+        return user
+    
+    user = db.scalar(_SELECT_USER_BY_ID, {"user_id": user_id})
     if user is None:
         logger.warning(f"User not found for ID: {user_id}")
         raise HTTPException(
@@ -62,18 +158,38 @@ def get_current_user(
             detail="User not found or inactive",
         )
     
+    # Detach so the cached instance does not pin this request's session
+    db.expunge(user)
+    _cache_user(user)
     return user
 
 
+def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db_session)
+) -> int:
+    """Get the authenticated user's id for endpoints that only need it for attribution.
+
+    Same checks as get_current_user, but a cache miss reads just `is_active`
+    instead of loading a full User instance.
+    """
+    user_id = _authenticate_token(credentials.credentials)
+    if _get_cached_user(user_id) is not None:
+        return user_id
+    
+    if not db.scalar(_SELECT_USER_IS_ACTIVE, {"user_id": user_id}):
+        logger.warning(f"User not found or inactive for ID: {user_id}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found or inactive",
+        )
+    return user_id
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token."""
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode["exp"] = datetime.utcnow() + (expires_delta or ACCESS_TOKEN_TTL)
+    encoded_jwt = _jwt_codec.encode(to_encode, _JWT_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -7,6 +7,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
 from loguru import logger
@@ -28,6 +29,7 @@ logger.info("DEBUG: Routers imported successfully")
 
 from database.init_crm import init_crm
 from services.uploads_cleanup import cleanup_uploads
+from services.webhook_log_writer import webhook_log_batcher
 
 print("DEBUG: init_crm imported successfully")
 logger.info("DEBUG: init_crm imported successfully")
@@ -39,20 +41,23 @@ async def lifespan(app: FastAPI):
     print("DEBUG: lifespan() called!")
     logger.info("DEBUG: lifespan() called!")
     # Настраиваем логирование для API
+    # enqueue=True: запись (и форматирование трейсбеков) в фоновом потоке, а не в обработчике запроса
     import sys
     logger.remove()  # Удаляем стандартный handler
     logger.add(
         sys.stdout,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>",
         level="INFO",
-        colorize=True
+        colorize=True,
+        enqueue=True,
     )
     try:
         logger.add(
             "logs/api.log",
             rotation="10 MB",
             level="INFO",
-            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function} - {message}"
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function} - {message}",
+            enqueue=True,
         )
         print("DEBUG: Logger configured successfully")
     except Exception as e:
@@ -89,6 +94,8 @@ async def lifespan(app: FastAPI):
     logger.info("Application startup complete")
     yield
     logger.info("Shutting down CRM API...")
+    # Write webhook logs still waiting for their batch
+    await webhook_log_batcher.stop()
 
 
 print("DEBUG: Creating FastAPI app...")
@@ -98,87 +105,32 @@ app = FastAPI(
     title="Fitness Trainer CRM API",
     description="CRM system for managing fitness training clients, programs, and sales pipeline",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson: быстрее стандартного json и сам сериализует datetime
+    default_response_class=ORJSONResponse,
 )
 
 print("DEBUG: FastAPI app created successfully")
 logger.info("DEBUG: FastAPI app created successfully")
 
-# Кастомный обработчик для null origin (file:// протокол) - должен быть ПЕРЕД CORS middleware
-from fastapi import Request
-from fastapi.responses import JSONResponse
-
-@app.middleware("http")
-async def cors_handler(request: Request, call_next):
-    """Дополнительная обработка CORS для null origin и preflight запросов."""
-    # Обработка preflight запросов (OPTIONS)
-    if request.method == "OPTIONS":
-        response = JSONResponse(content={})
-        origin = request.headers.get("origin")
-        if origin is None or origin == "null" or origin == "":
-            response.headers["Access-Control-Allow-Origin"] = "*"
-        else:
-            response.headers["Access-Control-Allow-Origin"] = origin
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        response.headers["Access-Control-Max-Age"] = "3600"
-        return response
-    
-    # Обработка обычных запросов
-    response = await call_next(request)
-    
-    # Если origin отсутствует (null origin для file://), добавляем заголовки
-    origin = request.headers.get("origin")
-    if origin is None or origin == "null" or origin == "":
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-    
-    return response
-
 # CORS middleware
-# Для локальной разработки разрешаем все localhost и 127.0.0.1 на любых портах
-is_dev = os.getenv("ENVIRONMENT", "development") == "development"
-
+# Продакшн-домены перечислены явно; null origin (file:// протокол), file:// и
+# localhost/127.0.0.1 на любом порту разрешены одним регулярным выражением
+# (Starlette компилирует его один раз при старте)
 cors_origins = [
     "https://www.batoohan.ru",
     "https://batoohan.ru",
 ]
 
-# В режиме разработки добавляем все возможные локальные адреса
-if is_dev:
-    # Добавляем стандартные порты для разработки
-    local_origins = [
-        "http://localhost",
-        "http://127.0.0.1",
-        "http://localhost:3000",
-        "http://localhost:5173",
-        "http://localhost:8000",
-        "http://localhost:8009",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:8000",
-        "http://127.0.0.1:8009",
-        # Добавляем варианты для статического сайта на разных портах
-        "http://localhost:5500",  # Live Server
-        "http://localhost:8080",  # Python http.server
-        "http://localhost:5000",  # Flask default
-        "http://127.0.0.1:5500",
-        "http://127.0.0.1:8080",
-        "http://127.0.0.1:5000",
-        "file:///",
-    ]
-    cors_origins.extend(local_origins)
-
-# Настройка CORS с поддержкой null origin для file:// протокола
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
-    allow_origin_regex=r"http://localhost:\d+|http://127\.0\.0\.1:\d+",  # Разрешаем любой порт localhost
+    allow_origin_regex=r"null|file://.*|https?://(localhost|127\.0\.0\.1)(:\d+)?",
     allow_credentials=False,  # Отключаем credentials для работы с null origin
     allow_methods=["*"],
     allow_headers=["*"],
     expose_headers=["*"],
+    max_age=3600,
 )
 
 # Static files (uploads)
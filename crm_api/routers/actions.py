@@ -1,9 +1,10 @@
 """Actions router."""
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field, field_serializer
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from pydantic import BaseModel, Field, TypeAdapter, field_serializer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from crm_api.dependencies import get_current_user
@@ -22,9 +23,10 @@ class ClientActionResponse(BaseModel):
     action_date: datetime | str
     description: str | None = None
     created_by: int | None = None
+    created_at: datetime | str | None = None
 
-    @field_serializer("action_date")
-    def serialize_datetime(self, value: datetime | str, _info) -> str:
+    @field_serializer("action_date", "created_at")
+    def serialize_datetime(self, value: datetime | str | None, _info) -> str | None:
         return value.isoformat() if isinstance(value, datetime) else value
 
     class Config:
@@ -67,18 +69,23 @@ class ActionCreateResponse(BaseModel):
     client: ClientSnapshot
 
 
-@router.get("")
+# Built once at import: the endpoint validates straight from ORM objects and
+# serializes to JSON bytes in pydantic-core, bypassing FastAPI's re-validation
+_ACTION_CREATE_ADAPTER = TypeAdapter(ActionCreateResponse)
+
+
+@router.get("", response_model=List[ClientActionResponse])
 async def get_actions(
     client_id: int | None = None,
     db: Session = Depends(get_db_session),
     current_user: User = Depends(get_current_user),
 ):
     """Get list of actions."""
-    query = db.query(ClientAction)
+    stmt = select(ClientAction)
     if client_id:
-        query = query.filter(ClientAction.client_id == client_id)
+        stmt = stmt.where(ClientAction.client_id == client_id)
 
-    actions = query.order_by(ClientAction.action_date.desc()).limit(100).all()
+    actions = db.scalars(stmt.order_by(ClientAction.action_date.desc()).limit(100)).all()
     return actions
 
 
@@ -89,7 +96,7 @@ async def create_action(
     current_user: User = Depends(get_current_user),
 ):
     """Create new action and apply pipeline automation."""
-    client = db.query(Client).filter(Client.id == action_data.client_id).first()
+    client = db.scalar(select(Client).where(Client.id == action_data.client_id))
     if not client:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
 
@@ -101,6 +108,8 @@ async def create_action(
         created_by=current_user.id,
     )
     db.add(action)
+    # Assign the primary key without committing; every other column is set in Python
+    db.flush()
 
     automation = PipelineAutomation(db)
     automation_result = automation.handle_action_created(
@@ -110,13 +119,16 @@ async def create_action(
         follow_up_hours_override=action_data.follow_up_hours,
     )
 
+    # Snapshot before commit: the session expires instances on commit and
+    # reading them afterwards would reload both rows with extra SELECTs
+    response = _ACTION_CREATE_ADAPTER.validate_python(
+        {"action": action, "automation": automation_result, "client": client}
+    )
     db.commit()
-    db.refresh(action)
-    db.refresh(client)
 
-    return ActionCreateResponse(
-        action=ClientActionResponse.model_validate(action),
-        automation=automation_result,
-        client=ClientSnapshot.model_validate(client),
+    return Response(
+        content=_ACTION_CREATE_ADAPTER.dump_json(response),
+        media_type="application/json",
+        status_code=status.HTTP_201_CREATED,
     )
 
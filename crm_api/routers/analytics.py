@@ -1,11 +1,11 @@
 """Analytics router."""
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database.db import get_db_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_async_db
 from database.models import Client, Payment, TrainingProgram
 from database.models_crm import PipelineStage, User
 from crm_api.dependencies import get_current_user
-from sqlalchemy import func
+from sqlalchemy import case, func, select, true
 from datetime import datetime, timedelta
 
 router = APIRouter()
@@ -13,19 +13,37 @@ router = APIRouter()
 
 @router.get("/overview")
 async def get_overview(
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get overview statistics."""
-    total_clients = db.query(Client).count()
-    active_clients = db.query(Client).filter(Client.status == "client").count()
-    total_programs = db.query(TrainingProgram).count()
-    paid_programs = db.query(TrainingProgram).filter(TrainingProgram.is_paid == True).count()
-    
-    # Revenue
-    total_revenue = db.query(func.sum(Payment.amount)).filter(
-        Payment.status == "completed"
-    ).scalar() or 0
+    # One round-trip: each table is aggregated in its own single-row subquery
+    client_stats = select(
+        func.count(Client.id).label("total"),
+        func.count(case((Client.status == "client", 1))).label("active"),
+    ).subquery()
+    program_stats = select(
+        func.count(TrainingProgram.id).label("total"),
+        func.count(case((TrainingProgram.is_paid == True, 1))).label("paid"),
+    ).subquery()
+    revenue_stats = select(
+        func.coalesce(func.sum(Payment.amount), 0).label("total"),
+    ).where(Payment.status == "completed").subquery()
+
+    row = (
+        await db.execute(
+            select(
+                client_stats.c.total,
+                client_stats.c.active,
+                program_stats.c.total,
+                program_stats.c.paid,
+                revenue_stats.c.total,
+            ).select_from(
+                client_stats.join(program_stats, true()).join(revenue_stats, true())
+            )
+        )
+    ).one()
+    total_clients, active_clients, total_programs, paid_programs, total_revenue = row
     
     return {
         "total_clients": total_clients,
@@ -38,45 +56,59 @@ async def get_overview(
 
 @router.get("/conversion")
 async def get_conversion_analytics(
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get conversion funnel analytics."""
-    stages = db.query(PipelineStage).filter(PipelineStage.is_active == True).order_by(PipelineStage.order).all()
+    rows = await db.execute(
+        select(
+            PipelineStage.id,
+            PipelineStage.name,
+            PipelineStage.color,
+            func.count(Client.id),
+        )
+        .join(Client, Client.pipeline_stage_id == PipelineStage.id, isouter=True)
+        .where(PipelineStage.is_active == True)
+        .group_by(PipelineStage.id, PipelineStage.name, PipelineStage.color, PipelineStage.order)
+        .order_by(PipelineStage.order)
+    )
     
-    conversion_data = []
-    for stage in stages:
-        count = db.query(Client).filter(Client.pipeline_stage_id == stage.id).count()
-        conversion_data.append({
-            "stage_id": stage.id,
-            "stage_name": stage.name,
+    return [
+        {
+            "stage_id": stage_id,
+            "stage_name": name,
             "count": count,
-            "color": stage.color
-        })
-    
-    return conversion_data
+            "color": color
+        }
+        for stage_id, name, color, count in rows
+    ]
 
 
 @router.get("/revenue")
 async def get_revenue_analytics(
     days: int = 30,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get revenue analytics."""
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    payments = db.query(Payment).filter(
-        Payment.status == "completed",
-        Payment.completed_at >= start_date
-    ).all()
-    
-    total_revenue = sum(p.amount for p in payments)
+    total_revenue, payment_count, average_payment = (
+        await db.execute(
+            select(
+                func.coalesce(func.sum(Payment.amount), 0),
+                func.count(Payment.id),
+                func.avg(Payment.amount),
+            ).where(
+                Payment.status == "completed",
+                Payment.completed_at >= start_date
+            )
+        )
+    ).one()
     
     return {
         "period_days": days,
         "total_revenue": float(total_revenue),
-        "payment_count": len(payments),
-        "average_payment": float(total_revenue / len(payments)) if payments else 0
+        "payment_count": payment_count,
+        "average_payment": float(average_payment) if payment_count else 0
     }
-
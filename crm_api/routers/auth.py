@@ -2,16 +2,83 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 from database.db import get_db_session
 from database.models_crm import User
 from crm_api.dependencies import create_access_token, security, get_current_user
-from datetime import timedelta
+from config import BCRYPT_ROUNDS, JWT_SECRET_KEY
+import anyio
 import bcrypt
+import hashlib
+import hmac
+import threading
+import time
 from loguru import logger
 
 router = APIRouter()
 
+# Recently verified (password, hash) pairs: repeated logins skip bcrypt.
+# Keys are HMACs, so plaintext passwords are never kept; only successes are cached.
+PASSWORD_CACHE_SIZE = 1024
+PASSWORD_CACHE_TTL_SECONDS = 5 * 60
+
+# Built once so every login reuses the same statement (and its compiled SQL);
+# only the columns login needs, read as a plain row without ORM instrumentation
+_SELECT_USER_BY_USERNAME = (
+    select(User.id, User.username, User.email, User.role, User.is_active, User.password_hash)
+    .where(User.username == bindparam("username"))
+    .limit(1)
+)
+
+_PASSWORD_CACHE_KEY = JWT_SECRET_KEY.encode("utf-8")
+_password_cache: dict[bytes, float] = {}
+_password_cache_lock = threading.Lock()
+
+
+async def _verify_password(password: str, password_hash: str) -> bool:
+    """Check password against a bcrypt hash, with a short-lived cache of successful checks."""
+    password_bytes = password.encode('utf-8')
+    hash_bytes = password_hash.encode('utf-8')
+    # The hash is part of the key, so a password change invalidates old entries
+    key = hmac.new(_PASSWORD_CACHE_KEY, hash_bytes + password_bytes, hashlib.sha256).digest()
+
+    with _password_cache_lock:
+        expires_at = _password_cache.get(key)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                return True
+            del _password_cache[key]
+
+    # bcrypt is deliberately slow, run it off the event loop
+    valid = await anyio.to_thread.run_sync(bcrypt.checkpw, password_bytes, hash_bytes)
+    if valid:
+        with _password_cache_lock:
+            if len(_password_cache) >= PASSWORD_CACHE_SIZE:
+                _password_cache.clear()
+            _password_cache[key] = time.monotonic() + PASSWORD_CACHE_TTL_SECONDS
+    return valid
+
+
+def _bcrypt_rounds(password_hash: str) -> int | None:
+    """Cost factor of a "$2b$12$..." hash, or None if it cannot be parsed."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+async def _rehash_if_needed(db: Session, user_id: int, password: str, password_hash: str) -> None:
+    """Silently migrate a hash whose cost differs from BCRYPT_ROUNDS after a successful login."""
+    if _bcrypt_rounds(password_hash) == BCRYPT_ROUNDS:
+        return
+    new_hash = await anyio.to_thread.run_sync(
+        bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    )
+    db.execute(update(User).where(User.id == user_id).values(password_hash=new_hash.decode('utf-8')))
+    db.commit()
+    logger.info(f"Password hash for user {user_id} re-hashed with cost {BCRYPT_ROUNDS}")
+
 
 class LoginRequest(BaseModel):
     username: str
@@ -39,7 +106,7 @@ class UserResponse(BaseModel):
 async def login(credentials: LoginRequest, db: Session = Depends(get_db_session)):
     """Login endpoint."""
     logger.info(f"Login attempt for username: {credentials.username}")
-    user = db.query(User).filter(User.username == credentials.username).first()
+    user = db.execute(_SELECT_USER_BY_USERNAME, {"username": credentials.username}).first()
     
     if not user:
         logger.warning(f"User not found: {credentials.username}")
@@ -57,28 +124,28 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db_session)
     
     # Check password
     try:
-        password_valid = bcrypt.checkpw(
-            credentials.password.encode('utf-8'),
-            user.password_hash.encode('utf-8')
-        )
-        if not password_valid:
-            logger.warning(f"Invalid password for user: {credentials.username}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-            )
+        password_valid = await _verify_password(credentials.password, user.password_hash)
     except Exception as e:
         logger.error(f"Error checking password: {e}")
+        password_valid = False
+    
+    if not password_valid:
+        logger.warning(f"Invalid password for user: {credentials.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=30 * 24 * 60)  # 30 days
+    try:
+        await _rehash_if_needed(db, user.id, credentials.password, user.password_hash)
+    except Exception as e:
+        # Login must not fail because of the migration; the old hash stays valid
+        db.rollback()
+        logger.error(f"Error re-hashing password for user {user.id}: {e}")
+    
+    # Create access token (default lifetime: ACCESS_TOKEN_TTL, 30 days)
     access_token = create_access_token(
         data={"sub": str(user.id)},  # JWT subject must be a string
-        expires_delta=access_token_expires
     )
     
     logger.info(f"Login successful for user: {credentials.username} (ID: {user.id})")
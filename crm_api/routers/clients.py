@@ -1,17 +1,49 @@
 """Clients router."""
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, exists, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel
 from datetime import datetime
 from database.db import get_db_session
-from database.models import Client
-from database.models_crm import User
+from database.models import Client, Payment, TrainingProgram
+from database.models_crm import (
+    User,
+    ClientPipeline,
+    PipelineStage,
+    ClientAction,
+    ClientContact,
+    ProgressJournal,
+    Reminder,
+    ClientBotLink,
+    ClientChannelPreference,
+    CampaignDelivery,
+    PromoUsage,
+)
 from crm_api.dependencies import get_current_user
 from loguru import logger
+import traceback
 
 router = APIRouter()
 
+# Таблицы со ссылкой на клиента, в порядке удаления:
+# журналы прогресса -> платежи -> программы -> напоминания -> pipeline/history/actions/contacts -> маркетинг -> бот ссылки
+CLIENT_CHILD_TABLES = (
+    ProgressJournal.__table__,
+    Payment.__table__,
+    TrainingProgram.__table__,
+    Reminder.__table__,
+    ClientPipeline.__table__,
+    ClientAction.__table__,
+    ClientContact.__table__,
+    ClientChannelPreference.__table__,
+    CampaignDelivery.__table__,
+    PromoUsage.__table__,
+    ClientBotLink.__table__,
+)
+
 
 class ClientResponse(BaseModel):
     id: int
@@ -27,12 +59,6 @@ class ClientResponse(BaseModel):
     created_at: datetime | str
     updated_at: datetime | str
 
-    @field_serializer('created_at', 'updated_at')
-    def serialize_datetime(self, value: datetime | str, _info) -> str:
-        if isinstance(value, datetime):
-            return value.isoformat()
-        return value
-
     class Config:
         from_attributes = True
 
@@ -52,11 +78,19 @@ class ClientDetailResponse(ClientResponse):
     last_contact_at: datetime | str | None
     next_contact_at: datetime | str | None
 
-    @field_serializer('last_contact_at', 'next_contact_at')
-    def serialize_datetime_optional(self, value: datetime | str | None, _info) -> str | None:
-        if isinstance(value, datetime):
-            return value.isoformat()
-        return value
+
+# Поля, которые можно менять через PUT (только существующие колонки clients)
+CLIENT_UPDATABLE_FIELDS = frozenset({
+    "first_name", "last_name", "phone_number", "age", "gender",
+    "height", "weight", "bmi", "experience_level", "fitness_goals",
+    "health_restrictions", "lifestyle", "location", "equipment",
+    "nutrition", "status", "pipeline_stage_id", "last_contact_at",
+    "next_contact_at",
+}).intersection(Client.__table__.columns.keys())
+
+# Read endpoints select these columns straight into dicts (no ORM objects, no validation)
+CLIENT_LIST_COLUMNS = tuple(getattr(Client, field) for field in ClientResponse.model_fields)
+CLIENT_DETAIL_COLUMNS = tuple(getattr(Client, field) for field in ClientDetailResponse.model_fields)
 
 
 class ClientCreateRequest(BaseModel):
@@ -81,14 +115,6 @@ async def create_client(
     current_user: User = Depends(get_current_user)
 ):
     """Create a new client."""
-    # Check if client with this telegram_id already exists
-    existing = db.query(Client).filter(Client.telegram_id == client_data.telegram_id).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Client with telegram_id {client_data.telegram_id} already exists"
-        )
-    
     # Create new client
     client = Client(
         telegram_id=client_data.telegram_id,
@@ -105,7 +131,23 @@ async def create_client(
     )
     
     db.add(client)
-    db.commit()
+    # telegram_id is UNIQUE: the insert itself detects duplicates, no lookup beforehand
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Only the failure path looks up which constraint was hit (unique telegram_id or the stage FK)
+        if db.scalar(select(exists().where(Client.telegram_id == client_data.telegram_id))):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Client with telegram_id {client_data.telegram_id} already exists"
+            )
+        if client_data.pipeline_stage_id is not None and not db.get(PipelineStage, client_data.pipeline_stage_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Pipeline stage {client_data.pipeline_stage_id} not found"
+            )
+        raise
     db.refresh(client)
     
     logger.info(f"Client created: {client.id} (telegram_id: {client.telegram_id}) by user {current_user.id}")
@@ -123,16 +165,16 @@ async def get_clients(
     current_user: User = Depends(get_current_user)
 ):
     """Get list of clients with pagination and filters."""
-    query = db.query(Client)
+    stmt = select(*CLIENT_LIST_COLUMNS)
     
     if status:
-        query = query.filter(Client.status == status)
+        stmt = stmt.where(Client.status == status)
     if pipeline_stage_id:
-        query = query.filter(Client.pipeline_stage_id == pipeline_stage_id)
+        stmt = stmt.where(Client.pipeline_stage_id == pipeline_stage_id)
     
-    clients = query.order_by(Client.created_at.desc()).offset(skip).limit(limit).all()
-    # Convert to response models to ensure proper serialization
-    return [ClientResponse.model_validate(client) for client in clients]
+    rows = db.execute(stmt.order_by(Client.created_at.desc()).offset(skip).limit(limit)).mappings()
+    # Plain rows serialized by orjson: no ORM hydration, no response model validation
+    return ORJSONResponse([dict(row) for row in rows])
 
 
 @router.get("/{client_id}", response_model=ClientDetailResponse)
@@ -142,13 +184,13 @@ async def get_client(
     current_user: User = Depends(get_current_user)
 ):
     """Get client details."""
-    client = db.query(Client).filter(Client.id == client_id).first()
-    if not client:
+    row = db.execute(select(*CLIENT_DETAIL_COLUMNS).where(Client.id == client_id)).mappings().first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Client not found"
         )
-    return ClientDetailResponse.model_validate(client)
+    return ORJSONResponse(dict(row))
 
 
 @router.put("/{client_id}", response_model=ClientDetailResponse)
@@ -159,7 +201,7 @@ async def update_client(
     current_user: User = Depends(get_current_user)
 ):
     """Update client information."""
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = db.get(Client, client_id)
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -167,17 +209,8 @@ async def update_client(
         )
     
     # Update allowed fields
-    allowed_fields = [
-        "first_name", "last_name", "phone_number", "age", "gender",
-        "height", "weight", "bmi", "experience_level", "fitness_goals",
-        "health_restrictions", "lifestyle", "location", "equipment",
-        "nutrition", "status", "pipeline_stage_id", "last_contact_at",
-        "next_contact_at"
-    ]
-    
-    for field, value in client_data.items():
-        if field in allowed_fields and hasattr(client, field):
-            setattr(client, field, value)
+    for field in CLIENT_UPDATABLE_FIELDS & client_data.keys():
+        setattr(client, field, client_data[field])
     
     db.commit()
     db.refresh(client)
@@ -191,7 +224,7 @@ async def delete_client(
     current_user: User = Depends(get_current_user)
 ):
     """Delete a client."""
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = db.get(Client, client_id)
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -200,69 +233,16 @@ async def delete_client(
     
     logger.info(f"Deleting client: {client_id} (telegram_id: {client.telegram_id}) by user {current_user.id}")
     
-    # Удаляем связанные записи вручную (SQLite без каскадов)
-    from database.models import Payment, TrainingProgram
-    from database.models_crm import (
-        ClientPipeline,
-        ClientAction,
-        ClientContact,
-        ProgressJournal,
-        Reminder,
-        ClientBotLink,
-        ClientChannelPreference,
-        CampaignDelivery,
-        PromoUsage,
-    )
-
-    logger.info(f"Deleting related records for client {client_id}")
-
-    # Отключаем lazy loading для избежания проблем с отсутствующими колонками
-    # Используем прямые SQL запросы для удаления связанных записей
-    from sqlalchemy import text
-    
+    # Удаляем связанные записи вручную (SQLite без каскадов), одной транзакцией
     try:
-        # Порядок: журналы прогресса -> платежи -> программы -> напоминания -> pipeline/history/actions/contacts -> маркетинг -> бот ссылки -> сам клиент
-        db.execute(text("DELETE FROM progress_journals WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted progress journals for client {client_id}")
-        
-        db.execute(text("DELETE FROM payments WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted payments for client {client_id}")
-        
-        db.execute(text("DELETE FROM training_programs WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted training programs for client {client_id}")
-        
-        db.execute(text("DELETE FROM reminders WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted reminders for client {client_id}")
-        
-        db.execute(text("DELETE FROM client_pipelines WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client pipelines for client {client_id}")
-        
-        db.execute(text("DELETE FROM client_actions WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client actions for client {client_id}")
-        
-        db.execute(text("DELETE FROM client_contacts WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client contacts for client {client_id}")
-        
-        db.execute(text("DELETE FROM client_channel_preferences WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client channel preferences for client {client_id}")
-        
-        db.execute(text("DELETE FROM campaign_deliveries WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted campaign deliveries for client {client_id}")
-        
-        db.execute(text("DELETE FROM promo_code_usages WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted promo code usages for client {client_id}")
-        
-        db.execute(text("DELETE FROM client_bot_links WHERE client_id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client bot links for client {client_id}")
-        
+        for table in CLIENT_CHILD_TABLES:
+            db.execute(delete(table).where(table.c.client_id == client_id))
         # Удаляем самого клиента
-        db.execute(text("DELETE FROM clients WHERE id = :client_id"), {"client_id": client_id})
-        logger.info(f"Deleted client {client_id}")
+        db.execute(delete(Client.__table__).where(Client.__table__.c.id == client_id))
         
         db.commit()
     except Exception as e:
         logger.error(f"Error deleting client {client_id}: {e}")
-        import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         db.rollback()
         raise HTTPException(
@@ -281,27 +261,26 @@ async def get_client_payments(
     current_user: User = Depends(get_current_user)
 ):
     """Get client payments."""
-    from database.models import Payment
-    
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = db.get(Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     
-    payments = db.query(Payment).filter(Payment.client_id == client_id).order_by(Payment.created_at.desc()).all()
+    rows = db.execute(
+        select(
+            Payment.id,
+            Payment.amount,
+            Payment.currency,
+            Payment.payment_type,
+            Payment.status,
+            Payment.payment_method,
+            Payment.created_at,
+            Payment.completed_at,
+        )
+        .where(Payment.client_id == client_id)
+        .order_by(Payment.created_at.desc())
+    ).mappings()
     
-    return [
-        {
-            "id": p.id,
-            "amount": p.amount,
-            "currency": p.currency,
-            "payment_type": p.payment_type,
-            "status": p.status,
-            "payment_method": p.payment_method,
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "completed_at": p.completed_at.isoformat() if p.completed_at else None,
-        }
-        for p in payments
-    ]
+    return ORJSONResponse([dict(row) for row in rows])
 
 
 @router.get("/{client_id}/pipeline-history")
@@ -311,9 +290,7 @@ async def get_client_pipeline_history(
     current_user: User = Depends(get_current_user)
 ):
     """Get client's pipeline movement history."""
-    from database.models_crm import ClientPipeline, PipelineStage
-    
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = db.get(Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     
@@ -321,9 +298,16 @@ async def get_client_pipeline_history(
         ClientPipeline.client_id == client_id
     ).order_by(ClientPipeline.moved_at.desc()).all()
     
+    # One query for all stages in the history instead of one per entry
+    stage_ids = {entry.stage_id for entry in history}
+    stages_by_id = {
+        stage.id: stage
+        for stage in db.query(PipelineStage).filter(PipelineStage.id.in_(stage_ids)).all()
+    } if stage_ids else {}
+    
     result = []
     for entry in history:
-        stage = db.query(PipelineStage).filter(PipelineStage.id == entry.stage_id).first()
+        stage = stages_by_id.get(entry.stage_id)
         result.append({
             "id": entry.id,
             "stage_id": entry.stage_id,
@@ -1,5 +1,8 @@
 """Contacts router."""
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from typing import List
 from database.db import get_db_session
@@ -9,19 +12,32 @@ from crm_api.dependencies import get_current_user
 router = APIRouter()
 
 
+class ContactCreate(BaseModel):
+    client_id: int
+    contact_type: str
+    contact_data: str | None = None
+    message_text: str | None = None
+    direction: str
+
+
 @router.get("")
 async def get_contacts(
     client_id: int | None = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
     db: Session = Depends(get_db_session),
     current_user: User = Depends(get_current_user)
 ):
     """Get list of contacts."""
-    query = db.query(ClientContact)
+    contacts_table = ClientContact.__table__
+    stmt = select(contacts_table)
     if client_id:
-        query = query.filter(ClientContact.client_id == client_id)
+        stmt = stmt.where(contacts_table.c.client_id == client_id)
     
-    contacts = query.order_by(ClientContact.created_at.desc()).limit(100).all()
-    return contacts
+    # Served by ix_contacts_client_created when filtered by client
+    stmt = stmt.order_by(contacts_table.c.created_at.desc()).offset(skip).limit(limit)
+    rows = db.execute(stmt).mappings()
+    return ORJSONResponse([dict(row) for row in rows])
 
 
 @router.post("")
@@ -37,3 +53,23 @@ async def create_contact(
     db.refresh(contact)
     return contact
 
+
+@router.post("/bulk")
+async def create_contacts_bulk(
+    items: List[ContactCreate],
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Create several contacts in one INSERT and one commit."""
+    if not items:
+        return ORJSONResponse([])
+
+    # render_nulls keeps rows with None values in the same batched INSERT
+    stmt = insert(ClientContact).returning(*ClientContact.__table__.c)
+    rows = db.execute(
+        stmt,
+        [item.model_dump() for item in items],
+        execution_options={"render_nulls": True},
+    ).mappings().all()
+    db.commit()
+    return ORJSONResponse([dict(row) for row in rows])
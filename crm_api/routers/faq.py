@@ -1,13 +1,13 @@
 """FAQ router for managing FAQ items."""
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from database.db import get_db_session
 from database.models_crm import FAQ
-from services.faq_service import FAQService
+from services.faq_service import FAQService, decode_keywords
 from loguru import logger
-import json
 
 router = APIRouter()
 
@@ -55,6 +55,22 @@ class FAQSearchRequest(BaseModel):
     limit: int = 5
 
 
+def _faq_to_dict(faq: FAQ) -> dict:
+    """FAQ row as a FAQResponse-shaped dict (keywords decoded, dates as ISO strings)."""
+    return {
+        "id": faq.id,
+        "question": faq.question,
+        "answer": faq.answer,
+        "category": faq.category,
+        "keywords": decode_keywords(faq.keywords),
+        "priority": faq.priority,
+        "is_active": faq.is_active,
+        "use_count": faq.use_count,
+        "created_at": faq.created_at.isoformat() if faq.created_at else "",
+        "updated_at": faq.updated_at.isoformat() if faq.updated_at else "",
+    }
+
+
 @router.get("", response_model=List[FAQResponse])
 async def get_faq(
     category: Optional[str] = None,
@@ -64,29 +80,7 @@ async def get_faq(
     """Get all FAQ items, optionally filtered."""
     faq_items = FAQService.get_all_faq(db, category=category, is_active=is_active)
     
-    result = []
-    for faq in faq_items:
-        keywords = None
-        if faq.keywords:
-            try:
-                keywords = json.loads(faq.keywords)
-            except:
-                keywords = None
-        
-        result.append(FAQResponse(
-            id=faq.id,
-            question=faq.question,
-            answer=faq.answer,
-            category=faq.category,
-            keywords=keywords,
-            priority=faq.priority,
-            is_active=faq.is_active,
-            use_count=faq.use_count,
-            created_at=faq.created_at.isoformat() if faq.created_at else "",
-            updated_at=faq.updated_at.isoformat() if faq.updated_at else "",
-        ))
-    
-    return result
+    return ORJSONResponse([_faq_to_dict(faq) for faq in faq_items])
 
 
 @router.get("/{faq_id}", response_model=FAQResponse)
@@ -99,25 +93,7 @@ async def get_faq_by_id(
     if not faq:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FAQ not found")
     
-    keywords = None
-    if faq.keywords:
-        try:
-            keywords = json.loads(faq.keywords)
-        except:
-            keywords = None
-    
-    return FAQResponse(
-        id=faq.id,
-        question=faq.question,
-        answer=faq.answer,
-        category=faq.category,
-        keywords=keywords,
-        priority=faq.priority,
-        is_active=faq.is_active,
-        use_count=faq.use_count,
-        created_at=faq.created_at.isoformat() if faq.created_at else "",
-        updated_at=faq.updated_at.isoformat() if faq.updated_at else "",
-    )
+    return ORJSONResponse(_faq_to_dict(faq))
 
 
 @router.post("", response_model=FAQResponse, status_code=status.HTTP_201_CREATED)
@@ -136,25 +112,7 @@ async def create_faq(
         created_by=None,  # TODO: Get from auth
     )
     
-    keywords = None
-    if faq.keywords:
-        try:
-            keywords = json.loads(faq.keywords)
-        except:
-            keywords = None
-    
-    return FAQResponse(
-        id=faq.id,
-        question=faq.question,
-        answer=faq.answer,
-        category=faq.category,
-        keywords=keywords,
-        priority=faq.priority,
-        is_active=faq.is_active,
-        use_count=faq.use_count,
-        created_at=faq.created_at.isoformat() if faq.created_at else "",
-        updated_at=faq.updated_at.isoformat() if faq.updated_at else "",
-    )
+    return ORJSONResponse(_faq_to_dict(faq), status_code=status.HTTP_201_CREATED)
 
 
 @router.put("/{faq_id}", response_model=FAQResponse)
@@ -179,25 +137,7 @@ async def update_faq(
     if not faq:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="FAQ not found")
     
-    keywords = None
-    if faq.keywords:
-        try:
-            keywords = json.loads(faq.keywords)
-        except:
-            keywords = None
-    
-    return FAQResponse(
-        id=faq.id,
-        question=faq.question,
-        answer=faq.answer,
-        category=faq.category,
-        keywords=keywords,
-        priority=faq.priority,
-        is_active=faq.is_active,
-        use_count=faq.use_count,
-        created_at=faq.created_at.isoformat() if faq.created_at else "",
-        updated_at=faq.updated_at.isoformat() if faq.updated_at else "",
-    )
+    return ORJSONResponse(_faq_to_dict(faq))
 
 
 @router.delete("/{faq_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -225,29 +165,7 @@ async def search_faq(
         limit=search_data.limit
     )
     
-    result = []
-    for faq in faq_items:
-        keywords = None
-        if faq.keywords:
-            try:
-                keywords = json.loads(faq.keywords)
-            except:
-                keywords = None
-        
-        result.append(FAQResponse(
-            id=faq.id,
-            question=faq.question,
-            answer=faq.answer,
-            category=faq.category,
-            keywords=keywords,
-            priority=faq.priority,
-            is_active=faq.is_active,
-            use_count=faq.use_count,
-            created_at=faq.created_at.isoformat() if faq.created_at else "",
-            updated_at=faq.updated_at.isoformat() if faq.updated_at else "",
-        ))
-    
-    return result
+    return ORJSONResponse([_faq_to_dict(faq) for faq in faq_items])
 
 
 @router.post("/ai-answer")
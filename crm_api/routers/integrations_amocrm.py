@@ -55,7 +55,7 @@ class PushClientPayload(BaseModel):
 
 @router.post("/push-client")
 async def push_client(payload: PushClientPayload, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    client = db.query(Client).filter(Client.id == payload.client_id).first()
+    client = db.get(Client, payload.client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     try:
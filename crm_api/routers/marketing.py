@@ -1,17 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import exists, func, select, tuple_
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from pydantic import BaseModel
-from database.db import get_db_session
-from crm_api.dependencies import get_current_user
+from database.db import dialect_insert, engine, get_db_session
+from crm_api.dependencies import get_current_user, get_current_user_id
 from database.models_crm import (
     MarketingCampaign, CampaignAudience, CampaignMessage, CampaignRun, ClientChannelPreference, CampaignDelivery, User, ClientAction
 )
-import json
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
+import orjson
 
 router = APIRouter()
 
+# Dashboards poll summary/timeseries: clients must revalidate, and get 304 while the data is unchanged
+_REVALIDATE_HEADERS = {"Cache-Control": "no-cache"}
+
+
+def _etag(*parts) -> str:
+    """Weak ETag from the values a response is derived from."""
+    return f'W/"{hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()}"'
+
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response if the client already has this ETag, otherwise None."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    if "*" in tags or etag in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **_REVALIDATE_HEADERS})
+    return None
+
+
+def _day_bucket(column):
+    """SQL expression giving the 'YYYY-MM-DD' day of a timestamp column."""
+    if engine.dialect.name == "sqlite":
+        return func.strftime("%Y-%m-%d", column)
+    return func.to_char(func.date_trunc("day", column), "YYYY-MM-DD")
+
 
 class CampaignBase(BaseModel):
     name: str
@@ -28,29 +57,21 @@ class CampaignResponse(CampaignBase):
         from_attributes = True
 
 
+# List endpoints select these columns straight into dicts (Core rows, no ORM instances)
+CAMPAIGN_LIST_COLUMNS = tuple(getattr(MarketingCampaign, field) for field in CampaignResponse.model_fields)
+
+
 @router.get("/campaigns", response_model=List[CampaignResponse])
 async def list_campaigns(db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    res = []
-    for c in db.query(MarketingCampaign).order_by(MarketingCampaign.created_at.desc()).all():
-        res.append(
-            CampaignResponse(
-                id=c.id,
-                name=c.name,
-                description=c.description,
-                status=c.status,
-                channel=c.channel,
-                schedule_at=c.schedule_at,
-                params=json.loads(c.params) if c.params else None,
-            )
-        )
-    return res
+    stmt = select(*CAMPAIGN_LIST_COLUMNS).order_by(MarketingCampaign.created_at.desc())
+    return ORJSONResponse([dict(row) for row in db.execute(stmt).mappings()])
 
 
 @router.post("/campaigns", response_model=CampaignResponse, status_code=status.HTTP_201_CREATED)
 async def create_campaign(
     payload: CampaignBase,
     db: Session = Depends(get_db_session),
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
 ):
     c = MarketingCampaign(
         name=payload.name,
@@ -58,21 +79,13 @@ async def create_campaign(
         status=payload.status or "draft",
         channel=payload.channel or "both",
         schedule_at=payload.schedule_at,
-        params=json.dumps(payload.params, ensure_ascii=False) if payload.params else None,
-        created_by=current_user.id if current_user else None,
+        params=payload.params or None,
+        created_by=current_user_id,
     )
     db.add(c)
     db.commit()
     db.refresh(c)
-    return CampaignResponse(
-        id=c.id,
-        name=c.name,
-        description=c.description,
-        status=c.status,
-        channel=c.channel,
-        schedule_at=c.schedule_at,
-        params=payload.params,
-    )
+    return CampaignResponse.model_validate(c)
 
 
 @router.put("/campaigns/{campaign_id}", response_model=CampaignResponse)
@@ -80,9 +93,9 @@ async def update_campaign(
     campaign_id: int,
     payload: CampaignBase,
     db: Session = Depends(get_db_session),
-    current_user: User = Depends(get_current_user),
+    current_user_id: int = Depends(get_current_user_id),
 ):
-    c = db.query(MarketingCampaign).filter(MarketingCampaign.id == campaign_id).first()
+    c = db.get(MarketingCampaign, campaign_id)
     if not c:
         raise HTTPException(status_code=404, detail="Campaign not found")
     c.name = payload.name
@@ -90,30 +103,22 @@ async def update_campaign(
     c.status = payload.status or c.status
     c.channel = payload.channel or c.channel
     c.schedule_at = payload.schedule_at
-    c.params = json.dumps(payload.params, ensure_ascii=False) if payload.params else None
-    c.updated_by = current_user.id if current_user else None
+    c.params = payload.params or None
+    c.updated_by = current_user_id
     db.commit()
     db.refresh(c)
-    return CampaignResponse(
-        id=c.id,
-        name=c.name,
-        description=c.description,
-        status=c.status,
-        channel=c.channel,
-        schedule_at=c.schedule_at,
-        params=payload.params,
-    )
+    return CampaignResponse.model_validate(c)
 
 
 @router.delete("/campaigns/{campaign_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_campaign(
     campaign_id: int, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)
 ):
-    c = db.query(MarketingCampaign).filter(MarketingCampaign.id == campaign_id).first()
+    c = db.get(MarketingCampaign, campaign_id)
     if not c:
         raise HTTPException(status_code=404, detail="Campaign not found")
     # Soft-constraint: Disallow deletion if runs exist (basic rule)
-    has_runs = db.query(CampaignRun).filter(CampaignRun.campaign_id == campaign_id).first()
+    has_runs = db.scalar(select(exists().where(CampaignRun.campaign_id == campaign_id)))
     if has_runs:
         raise HTTPException(status_code=400, detail="Campaign has runs; cancel or complete instead of delete")
     db.delete(c)
@@ -132,46 +137,39 @@ class AudienceResponse(AudienceBase):
     class Config:
         from_attributes = True
 
+AUDIENCE_LIST_COLUMNS = tuple(getattr(CampaignAudience, field) for field in AudienceResponse.model_fields)
+
 @router.get("/audiences", response_model=list[AudienceResponse])
 async def list_audiences(db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    res = []
-    for a in db.query(CampaignAudience).order_by(CampaignAudience.created_at.desc()).all():
-        res.append(
-            AudienceResponse(
-                id=a.id,
-                name=a.name,
-                description=a.description,
-                filter_json=(json.loads(a.filter_json) if a.filter_json else None),
-            )
-        )
-    return res
+    stmt = select(*AUDIENCE_LIST_COLUMNS).order_by(CampaignAudience.created_at.desc())
+    return ORJSONResponse([dict(row) for row in db.execute(stmt).mappings()])
 
 @router.post("/audiences", response_model=AudienceResponse, status_code=status.HTTP_201_CREATED)
-async def create_audience(payload: AudienceBase, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
+async def create_audience(payload: AudienceBase, db: Session = Depends(get_db_session), current_user_id: int = Depends(get_current_user_id)):
     a = CampaignAudience(
         name=payload.name,
         description=payload.description,
-        filter_json=json.dumps(payload.filter_json, ensure_ascii=False) if payload.filter_json else None,
-        created_by=current_user.id if current_user else None,
+        filter_json=payload.filter_json or None,
+        created_by=current_user_id,
     )
     db.add(a); db.commit(); db.refresh(a)
-    return AudienceResponse(id=a.id, name=a.name, description=a.description, filter_json=payload.filter_json)
+    return AudienceResponse.model_validate(a)
 
 @router.put("/audiences/{audience_id}", response_model=AudienceResponse)
-async def update_audience(audience_id: int, payload: AudienceBase, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    a = db.query(CampaignAudience).filter(CampaignAudience.id == audience_id).first()
+async def update_audience(audience_id: int, payload: AudienceBase, db: Session = Depends(get_db_session), current_user_id: int = Depends(get_current_user_id)):
+    a = db.get(CampaignAudience, audience_id)
     if not a:
         raise HTTPException(status_code=404, detail="Audience not found")
     a.name = payload.name
     a.description = payload.description
-    a.filter_json = json.dumps(payload.filter_json, ensure_ascii=False) if payload.filter_json else None
-    a.updated_by = current_user.id if current_user else None
+    a.filter_json = payload.filter_json or None
+    a.updated_by = current_user_id
     db.commit(); db.refresh(a)
-    return AudienceResponse(id=a.id, name=a.name, description=a.description, filter_json=payload.filter_json)
+    return AudienceResponse.model_validate(a)
 
 @router.delete("/audiences/{audience_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_audience(audience_id: int, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    a = db.query(CampaignAudience).filter(CampaignAudience.id == audience_id).first()
+    a = db.get(CampaignAudience, audience_id)
     if not a:
         raise HTTPException(status_code=404, detail="Audience not found")
     db.delete(a); db.commit()
@@ -189,36 +187,36 @@ class MessageResponse(MessageBase):
     class Config:
         from_attributes = True
 
+MESSAGE_LIST_COLUMNS = tuple(getattr(CampaignMessage, field) for field in MessageResponse.model_fields)
+
 @router.get("/messages", response_model=list[MessageResponse])
 async def list_messages(campaign_id: int | None = None, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    q = db.query(CampaignMessage)
+    stmt = select(*MESSAGE_LIST_COLUMNS)
     if campaign_id:
-        q = q.filter(CampaignMessage.campaign_id == campaign_id)
-    res = []
-    for m in q.order_by(CampaignMessage.created_at.desc()).all():
-        res.append(MessageResponse(id=m.id, campaign_id=m.campaign_id, title=m.title, body_text=m.body_text))
-    return res
+        stmt = stmt.where(CampaignMessage.campaign_id == campaign_id)
+    stmt = stmt.order_by(CampaignMessage.created_at.desc())
+    return ORJSONResponse([dict(row) for row in db.execute(stmt).mappings()])
 
 @router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
 async def create_message(payload: MessageBase, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
     m = CampaignMessage(campaign_id=payload.campaign_id, title=payload.title, body_text=payload.body_text)
     db.add(m); db.commit(); db.refresh(m)
-    return MessageResponse(id=m.id, campaign_id=m.campaign_id, title=m.title, body_text=m.body_text)
+    return MessageResponse.model_validate(m)
 
 @router.put("/messages/{message_id}", response_model=MessageResponse)
 async def update_message(message_id: int, payload: MessageBase, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    m = db.query(CampaignMessage).filter(CampaignMessage.id == message_id).first()
+    m = db.get(CampaignMessage, message_id)
     if not m:
         raise HTTPException(status_code=404, detail="Message not found")
     m.campaign_id = payload.campaign_id
     m.title = payload.title
     m.body_text = payload.body_text
     db.commit(); db.refresh(m)
-    return MessageResponse(id=m.id, campaign_id=m.campaign_id, title=m.title, body_text=m.body_text)
+    return MessageResponse.model_validate(m)
 
 @router.delete("/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_message(message_id: int, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    m = db.query(CampaignMessage).filter(CampaignMessage.id == message_id).first()
+    m = db.get(CampaignMessage, message_id)
     if not m:
         raise HTTPException(status_code=404, detail="Message not found")
     db.delete(m); db.commit()
@@ -230,131 +228,196 @@ class RunStartRequest(BaseModel):
     audience_id: int | None = None
     limit: int | None = 100
 
-@router.post("/campaigns/{campaign_id}/start", status_code=status.HTTP_201_CREATED)
-async def start_campaign_run(campaign_id: int, payload: RunStartRequest, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
+@router.post("/campaigns/{campaign_id}/start", status_code=status.HTTP_202_ACCEPTED)
+async def start_campaign_run(
+    campaign_id: int,
+    payload: RunStartRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
     from services.marketing_service import MarketingService
-    c = db.query(MarketingCampaign).filter(MarketingCampaign.id == campaign_id).first()
+    c = db.get(MarketingCampaign, campaign_id)
     if not c:
         raise HTTPException(status_code=404, detail="Campaign not found")
     audience = None
     if payload.audience_id:
-        audience = db.query(CampaignAudience).filter(CampaignAudience.id == payload.audience_id).first()
+        audience = db.get(CampaignAudience, payload.audience_id)
         if not audience:
             raise HTTPException(status_code=404, detail="Audience not found")
-    run = CampaignRun(campaign_id=campaign_id, audience_id=payload.audience_id, status="running", started_at=datetime.utcnow())
+    run = CampaignRun(campaign_id=campaign_id, audience_id=payload.audience_id, status="pending", started_at=datetime.utcnow())
     db.add(run); db.commit(); db.refresh(run)
 
-    # Process synchronously (first iteration). Later: background/cron.
-    processed = MarketingService.process_run(db, run, limit=payload.limit or 100)
+    # Sending can take minutes: process after the response, in a worker thread with its own
+    # session; progress is visible via /campaigns/{id}/runs
+    background_tasks.add_task(MarketingService.process_queued_run, run.id, payload.limit or 100)
 
-    run.status = "completed"
-    run.completed_at = datetime.utcnow()
-    db.commit(); db.refresh(run)
+    return {"run_id": run.id, "status": run.status}
 
-    return {"run_id": run.id, "processed": processed, "sent": run.sent, "errors": run.errors}
+
+RUN_LIST_COLUMNS = (
+    CampaignRun.id,
+    CampaignRun.status,
+    CampaignRun.total,
+    CampaignRun.sent,
+    CampaignRun.errors,
+    CampaignRun.started_at,
+    CampaignRun.completed_at,
+)
+
+DELIVERY_LIST_COLUMNS = (
+    CampaignDelivery.id,
+    CampaignDelivery.run_id,
+    CampaignDelivery.client_id,
+    CampaignDelivery.channel,
+    CampaignDelivery.status,
+    CampaignDelivery.created_at,
+)
 
 
 @router.get("/campaigns/{campaign_id}/runs")
-async def list_campaign_runs(campaign_id: int, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    runs = (
-        db.query(CampaignRun)
-        .filter(CampaignRun.campaign_id == campaign_id)
-        .order_by(CampaignRun.started_at.desc().nullslast())
-        .all()
-    )
-    return [
-        {
-            "id": r.id,
-            "status": r.status,
-            "total": r.total,
-            "sent": r.sent,
-            "errors": r.errors,
-            "started_at": r.started_at.isoformat() if r.started_at else None,
-            "completed_at": r.completed_at.isoformat() if r.completed_at else None,
-        }
-        for r in runs
-    ]
+async def list_campaign_runs(
+    campaign_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[datetime] = Query(None, description="started_at of the last run on the previous page"),
+    before_id: Optional[int] = Query(None, description="id of the last run on the previous page"),
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    # Keyset pagination on (started_at, id): each page is a range scan of ix_campaign_run_campaign_started,
+    # and id breaks ties so runs sharing the boundary started_at are not skipped
+    stmt = select(*RUN_LIST_COLUMNS).where(CampaignRun.campaign_id == campaign_id)
+    if before is not None:
+        if before_id is not None:
+            stmt = stmt.where(tuple_(CampaignRun.started_at, CampaignRun.id) < tuple_(before, before_id))
+        else:
+            stmt = stmt.where(CampaignRun.started_at < before)
+    # orjson writes datetimes as ISO 8601 itself, no per-row isoformat()
+    runs = db.execute(
+        stmt.order_by(CampaignRun.started_at.desc().nullslast(), CampaignRun.id.desc()).limit(limit)
+    ).mappings()
+    return ORJSONResponse([dict(r) for r in runs])
+
+
+# Deliveries are fetched and encoded in chunks of this many rows
+DELIVERY_STREAM_CHUNK = 500
 
 
 @router.get("/campaigns/{campaign_id}/deliveries")
-async def list_campaign_deliveries(campaign_id: int, db: Session = Depends(get_db_session), current_user: User = Depends(get_current_user)):
-    qs = (
-        db.query(CampaignDelivery)
-        .filter(CampaignDelivery.campaign_id == campaign_id)
+async def list_campaign_deliveries(
+    campaign_id: int,
+    limit: int = Query(500, ge=1, le=100_000),
+    db: Session = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+):
+    stmt = (
+        select(*DELIVERY_LIST_COLUMNS)
+        .where(CampaignDelivery.campaign_id == campaign_id)
         .order_by(CampaignDelivery.created_at.desc())
-        .limit(500)
-        .all()
+        .limit(limit)
     )
-    return [
-        {
-            "id": d.id,
-            "run_id": d.run_id,
-            "client_id": d.client_id,
-            "channel": d.channel,
-            "status": d.status,
-            "created_at": d.created_at.isoformat() if d.created_at else None,
-        }
-        for d in qs
-    ]
+
+    def stream():
+        # Same JSON array as before, but only one chunk of rows is held in memory at a time
+        result = db.execute(stmt, execution_options={"yield_per": DELIVERY_STREAM_CHUNK}).mappings()
+        try:
+            yield b"["
+            separator = b""
+            for chunk in result.partitions():
+                yield separator + b",".join(orjson.dumps(dict(d)) for d in chunk)
+                separator = b","
+            yield b"]"
+        finally:
+            result.close()
+
+    # Iterated in the threadpool, so the database reads do not block the event loop
+    return StreamingResponse(stream(), media_type="application/json")
 
 
 @router.get("/campaigns/{campaign_id}/summary")
 async def get_campaign_summary(
     campaign_id: int,
+    request: Request,
     db: Session = Depends(get_db_session),
     current_user: User = Depends(get_current_user),
 ):
-    total_runs = db.query(CampaignRun).filter(CampaignRun.campaign_id == campaign_id).count()
-    last_run = (
-        db.query(CampaignRun)
+    # Deliveries and actions are append-only and runs only add new start times,
+    # so counts and maxima identify the data the summary is computed from
+    version = db.execute(
+        select(
+            select(func.count(CampaignDelivery.id)).where(CampaignDelivery.campaign_id == campaign_id).scalar_subquery(),
+            select(func.max(CampaignDelivery.id)).where(CampaignDelivery.campaign_id == campaign_id).scalar_subquery(),
+            select(func.count(CampaignRun.id)).where(CampaignRun.campaign_id == campaign_id).scalar_subquery(),
+            select(func.max(CampaignRun.started_at)).where(CampaignRun.campaign_id == campaign_id).scalar_subquery(),
+            select(func.max(ClientAction.id)).scalar_subquery(),
+        )
+    ).one()
+    etag = _etag("summary", campaign_id, *version)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    # Only the start time of the last run is reported, so count and max fit in one query
+    total_runs, last_run_started_at = (
+        db.query(func.count(CampaignRun.id), func.max(CampaignRun.started_at))
         .filter(CampaignRun.campaign_id == campaign_id)
-        .order_by(CampaignRun.started_at.desc().nullslast())
-        .first()
+        .one()
     )
-    deliveries = db.query(CampaignDelivery).filter(CampaignDelivery.campaign_id == campaign_id).all()
-    unique_clients = len(set(d.client_id for d in deliveries))
-    sent_total = sum(1 for d in deliveries if d.status == "sent")
-    failed_total = sum(1 for d in deliveries if d.status == "failed")
+    # Counting is done by the database: one row per (channel, status) instead of every delivery
+    counts = (
+        db.query(CampaignDelivery.channel, CampaignDelivery.status, func.count().label("n"))
+        .filter(CampaignDelivery.campaign_id == campaign_id)
+        .group_by(CampaignDelivery.channel, CampaignDelivery.status)
+        .all()
+    )
+    sent_total = 0
+    failed_total = 0
     by_channel = {}
-    for d in deliveries:
-        ch = d.channel or "unknown"
+    for channel, delivery_status, n in counts:
+        ch = channel or "unknown"
         if ch not in by_channel:
             by_channel[ch] = {"sent": 0, "failed": 0, "total": 0}
-        by_channel[ch]["total"] += 1
-        if d.status == "sent":
-            by_channel[ch]["sent"] += 1
-        elif d.status == "failed":
-            by_channel[ch]["failed"] += 1
+        by_channel[ch]["total"] += n
+        if delivery_status == "sent":
+            by_channel[ch]["sent"] += n
+            sent_total += n
+        elif delivery_status == "failed":
+            by_channel[ch]["failed"] += n
+            failed_total += n
+    delivered_clients = db.query(CampaignDelivery.client_id).filter(CampaignDelivery.campaign_id == campaign_id)
+    unique_clients = (
+        db.query(func.count(func.distinct(CampaignDelivery.client_id)))
+        .filter(CampaignDelivery.campaign_id == campaign_id)
+        .scalar()
+    )
     # Conversions: count clients with PAYMENT_RECEIVED action after any delivery
-    delivered_client_ids = list(set(d.client_id for d in deliveries))
-    conversions = 0
-    if delivered_client_ids:
-        conversions = (
-            db.query(ClientAction)
-            .filter(
-                ClientAction.client_id.in_(delivered_client_ids),
-                ClientAction.action_type == "payment_received",
-            )
-            .count()
+    conversions = (
+        db.query(func.count(ClientAction.id))
+        .filter(
+            ClientAction.client_id.in_(delivered_clients),
+            ClientAction.action_type == "payment_received",
         )
+        .scalar()
+    )
     conversion_rate = (conversions / unique_clients) if unique_clients > 0 else 0.0
 
-    return {
+    return ORJSONResponse({
         "campaign_id": campaign_id,
         "total_runs": total_runs,
-        "last_run_started_at": last_run.started_at.isoformat() if last_run and last_run.started_at else None,
+        "last_run_started_at": last_run_started_at,
         "unique_clients": unique_clients,
         "sent_total": sent_total,
         "failed_total": failed_total,
         "by_channel": by_channel,
         "conversions": conversions,
         "conversion_rate": conversion_rate,
-    }
+    }, headers={"ETag": etag, **_REVALIDATE_HEADERS})
 
 
 @router.get("/campaigns/{campaign_id}/timeseries")
 async def get_campaign_timeseries(
     campaign_id: int,
+    request: Request,
     days: int = 7,
     db: Session = Depends(get_db_session),
     current_user: User = Depends(get_current_user),
@@ -363,32 +426,39 @@ async def get_campaign_timeseries(
     Simple time series of deliveries by day for the last N days.
     Returns [{ date: 'YYYY-MM-DD', total, sent, failed, telegram, email }].
     """
-    from datetime import timedelta
-    since = datetime.utcnow() - timedelta(days=max(1, min(days, 60)))
-    qs = (
-        db.query(CampaignDelivery)
-        .filter(CampaignDelivery.campaign_id == campaign_id)
-        .filter(CampaignDelivery.created_at >= since)
-        .order_by(CampaignDelivery.created_at.asc())
+    days = max(1, min(days, 60))
+    since = datetime.utcnow() - timedelta(days=days)
+    in_window = (CampaignDelivery.campaign_id == campaign_id, CampaignDelivery.created_at >= since)
+    # Index-only check: the count also changes when old deliveries leave the window
+    version = db.execute(select(func.count(CampaignDelivery.id), func.max(CampaignDelivery.id)).where(*in_window)).one()
+    etag = _etag("timeseries", campaign_id, days, *version)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    day = _day_bucket(CampaignDelivery.created_at).label("day")
+    # At most days x channels x statuses rows, bucketed by the database
+    counts = (
+        db.query(day, CampaignDelivery.channel, CampaignDelivery.status, func.count().label("n"))
+        .filter(*in_window)
+        .group_by(day, CampaignDelivery.channel, CampaignDelivery.status)
         .all()
     )
     bucket: dict[str, dict] = {}
-    for d in qs:
-        dt = d.created_at or datetime.utcnow()
-        key = dt.strftime("%Y-%m-%d")
+    for key, channel, delivery_status, n in counts:
         if key not in bucket:
             bucket[key] = {"date": key, "total": 0, "sent": 0, "failed": 0, "telegram": 0, "email": 0}
-        bucket[key]["total"] += 1
-        if d.status == "sent":
-            bucket[key]["sent"] += 1
-        elif d.status == "failed":
-            bucket[key]["failed"] += 1
-        ch = (d.channel or "").lower()
+        bucket[key]["total"] += n
+        if delivery_status == "sent":
+            bucket[key]["sent"] += n
+        elif delivery_status == "failed":
+            bucket[key]["failed"] += n
+        ch = (channel or "").lower()
         if ch in ("telegram", "email"):
-            bucket[key][ch] += 1
+            bucket[key][ch] += n
     series = list(bucket.values())
     series.sort(key=lambda x: x["date"])
-    return {"series": series}
+    return ORJSONResponse({"series": series}, headers={"ETag": etag, **_REVALIDATE_HEADERS})
 
 @router.post("/process-scheduled")
 async def process_scheduled_campaigns(
@@ -435,19 +505,22 @@ async def update_client_preferences(
     db: Session = Depends(get_db_session),
     current_user: User = Depends(get_current_user),
 ):
-    pref = db.query(ClientChannelPreference).filter(ClientChannelPreference.client_id == client_id).first()
-    if not pref:
-        pref = ClientChannelPreference(client_id=client_id)
-        db.add(pref)
-    if payload.allow_telegram is not None:
-        pref.allow_telegram = payload.allow_telegram
-    if payload.allow_email is not None:
-        pref.allow_email = payload.allow_email
-    if payload.quiet_hours_start is not None:
-        pref.quiet_hours_start = payload.quiet_hours_start
-    if payload.quiet_hours_end is not None:
-        pref.quiet_hours_end = payload.quiet_hours_end
-    db.commit(); db.refresh(pref)
+    # One atomic statement instead of SELECT + INSERT/UPDATE (no duplicate rows under concurrent PUTs)
+    updates = payload.model_dump(exclude_none=True)
+    updates["updated_at"] = datetime.utcnow()
+    stmt = (
+        dialect_insert(ClientChannelPreference)
+        .values(client_id=client_id, **updates)
+        .on_conflict_do_update(index_elements=[ClientChannelPreference.client_id], set_=updates)
+        .returning(
+            ClientChannelPreference.allow_telegram,
+            ClientChannelPreference.allow_email,
+            ClientChannelPreference.quiet_hours_start,
+            ClientChannelPreference.quiet_hours_end,
+        )
+    )
+    pref = db.execute(stmt).one()
+    db.commit()
     return {
         "client_id": client_id,
         "allow_telegram": pref.allow_telegram,
@@ -1,51 +1,148 @@
 """Payments router for webhook and payment management."""
-import json
+import threading
+import time
 import uuid
+
+import orjson
 from datetime import datetime
 from typing import Optional, Dict, Any
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Body
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
-from database.db import get_db_session
+from database.db import dialect_insert, get_async_db, get_db_session
 from database.models import Payment, PaymentWebhookLog, WebsiteSettings
 from database.models_crm import User
-from services.payment_service import PaymentService, PaymentService as PaymentServiceClass
+from services.payment_service import DuplicateWebhookEvent, PaymentService, PaymentService as PaymentServiceClass
 from loguru import logger
 from services.payments_tinkoff import verify_tinkoff_token, parse_tinkoff_status
 from config import TINKOFF_SECRET_KEY
 from services.payment_gateway import PaymentGateway
+from services.webhook_log_writer import webhook_log_batcher
 from crm_api.dependencies import get_current_user
 
 router = APIRouter()
 
 
+class YooKassaPaymentObject(BaseModel):
+    """Payment object inside a YooKassa notification (only the fields we use are declared)."""
+    id: str
+    status: str
+    metadata: Optional[Dict[str, Any]] = None
+
+    class Config:
+        extra = "allow"
+
+
 class YooKassaWebhookRequest(BaseModel):
     """YooKassa webhook request model."""
     type: str
     event: str
-    object: dict
+    object: YooKassaPaymentObject
+
+
+# Read endpoints select only these columns and return the rows as-is
+# (orjson writes datetimes as ISO 8601, no per-field isoformat())
+PAYMENT_DETAIL_COLUMNS = (
+    Payment.id,
+    Payment.client_id,
+    Payment.amount,
+    Payment.currency,
+    Payment.payment_type,
+    Payment.status,
+    Payment.payment_method,
+    Payment.payment_id,
+    Payment.promo_code,
+    Payment.discount_amount,
+    Payment.final_amount,
+    Payment.created_at,
+    Payment.completed_at,
+)
+WEBHOOK_LOG_COLUMNS = (
+    PaymentWebhookLog.id,
+    PaymentWebhookLog.provider,
+    PaymentWebhookLog.event,
+    PaymentWebhookLog.created_at,
+)
+
+# Built once so every request reuses the same statement (and its compiled SQL)
+_SELECT_PAYMENT_DETAIL = select(*PAYMENT_DETAIL_COLUMNS).where(Payment.id == bindparam("payment_id"))
+_SELECT_WEBHOOK_LOGS = (
+    select(*WEBHOOK_LOG_COLUMNS)
+    .order_by(PaymentWebhookLog.created_at.desc())
+    .limit(bindparam("limit"))
+)
+
+
+# Values come from a JSON body, so their type is one of the JSON types exactly:
+# one dict lookup instead of an isinstance chain (where bool had to be checked before int)
+_SETTING_ENCODERS = {
+    type(None): lambda value: ("", "string"),
+    bool: lambda value: ("true" if value else "false", "boolean"),
+    int: lambda value: (str(value), "number"),
+    float: lambda value: (str(value), "number"),
+    dict: lambda value: (orjson.dumps(value).decode(), "json"),
+}
+
+
+def _encode_setting(value: Any) -> tuple[str, str]:
+    """(setting_value, setting_type) for a JSON value, as stored in website_settings."""
+    encoder = _SETTING_ENCODERS.get(type(value))
+    if encoder is None:
+        return str(value), "string"
+    return encoder(value)
+
+
+# Decoded payment settings, reused for this many seconds; every write drops the cache
+PAYMENT_SETTINGS_CACHE_TTL_SECONDS = 30
+
+_payment_settings_cache: Optional[tuple[float, Dict[str, Any]]] = None
+_payment_settings_lock = threading.Lock()
+
+
+def invalidate_payment_settings_cache() -> None:
+    """Drop cached payment settings so the next read reloads them from the database."""
+    global _payment_settings_cache
+    with _payment_settings_lock:
+        _payment_settings_cache = None
+
+
+# Settings can also be edited through the generic website settings endpoints
+@event.listens_for(WebsiteSettings, "after_insert")
+@event.listens_for(WebsiteSettings, "after_update")
+@event.listens_for(WebsiteSettings, "after_delete")
+def _on_setting_changed(mapper, connection, target: WebsiteSettings) -> None:
+    invalidate_payment_settings_cache()
 
 
 @router.get("/settings", status_code=status.HTTP_200_OK)
 async def get_payment_settings(
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     """Return payment settings grouped in a flat dictionary."""
+    global _payment_settings_cache
+    with _payment_settings_lock:
+        cached = _payment_settings_cache
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
     rows = (
-        db.query(WebsiteSettings)
-        .filter(WebsiteSettings.category == "payments")
-        .all()
-    )
+        await db.scalars(select(WebsiteSettings).where(WebsiteSettings.category == "payments"))
+    ).all()
     result: Dict[str, Any] = {}
     for row in rows:
         value: Any = row.setting_value
         if row.setting_type == "json":
             try:
-                value = json.loads(row.setting_value or "{}")
-            except json.JSONDecodeError:
+                value = orjson.loads(row.setting_value) if row.setting_value else {}
+            except orjson.JSONDecodeError:
                 logger.warning(f"Failed to parse JSON setting {row.setting_key}")
         elif row.setting_type == "number":
             try:
@@ -55,105 +152,117 @@ async def get_payment_settings(
         elif row.setting_type == "boolean":
             value = str(row.setting_value).lower() == "true"
         result[row.setting_key] = value
+
+    with _payment_settings_lock:
+        _payment_settings_cache = (time.monotonic() + PAYMENT_SETTINGS_CACHE_TTL_SECONDS, result)
     return result
 
 
 @router.post("/settings", status_code=status.HTTP_200_OK)
 async def update_payment_settings(
     payload: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
 ):
     """Upsert payment settings in a single request."""
     if not isinstance(payload, dict):
         raise HTTPException(status_code=400, detail="Payload must be a JSON object")
 
-    existing_rows = (
-        db.query(WebsiteSettings)
-        .filter(WebsiteSettings.category == "payments")
-        .all()
-    )
-    existing_map = {row.setting_key: row for row in existing_rows}
+    if not payload:
+        return {"updated": 0}
 
-    updated = 0
+    now = datetime.utcnow()
+    rows = []
     for key, value in payload.items():
-        if value is None:
-            stored_value = ""
-            value_type = "string"
-        elif isinstance(value, bool):
-            stored_value = "true" if value else "false"
-            value_type = "boolean"
-        elif isinstance(value, (int, float)):
-            stored_value = str(value)
-            value_type = "number"
-        elif isinstance(value, dict):
-            stored_value = json.dumps(value, ensure_ascii=False)
-            value_type = "json"
-        else:
-            stored_value = str(value)
-            value_type = "string"
-
-        setting = existing_map.get(key)
-        if setting:
-            setting.setting_value = stored_value
-            setting.setting_type = value_type
-            setting.category = setting.category or "payments"
-            setting.updated_by = current_user.id if getattr(current_user, "id", None) else None
-        else:
-            setting = WebsiteSettings(
-                setting_key=key,
-                setting_value=stored_value,
-                setting_type=value_type,
-                category="payments",
-                updated_by=current_user.id if getattr(current_user, "id", None) else None,
-            )
-            db.add(setting)
-            existing_map[key] = setting
-        updated += 1
+        stored_value, value_type = _encode_setting(value)
+        rows.append({
+            "setting_key": key,
+            "setting_value": stored_value,
+            "setting_type": value_type,
+            "category": "payments",
+            "updated_at": now,
+            "updated_by": current_user.id,
+        })
+
+    # One INSERT ... ON CONFLICT (setting_key) for all keys instead of SELECT + an UPDATE per row
+    stmt = dialect_insert(WebsiteSettings).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WebsiteSettings.setting_key],
+        set_={
+            "setting_value": stmt.excluded.setting_value,
+            "setting_type": stmt.excluded.setting_type,
+            # An existing key keeps its category
+            "category": func.coalesce(WebsiteSettings.category, stmt.excluded.category),
+            "updated_at": stmt.excluded.updated_at,
+            "updated_by": stmt.excluded.updated_by,
+        },
+    )
+    await db.execute(stmt)
+    await db.commit()
+    # Core upsert: the ORM write events above do not fire
+    invalidate_payment_settings_cache()
+    return {"updated": len(rows)}
 
-    db.commit()
-    return {"updated": updated}
+
+# Provider notifications are a few KiB; larger bodies are rejected before they are read in full
+WEBHOOK_MAX_BODY_BYTES = 64 * 1024
+
+
+async def _read_webhook_body(request: Request) -> bytes:
+    """Read a webhook body, answering 413 as soon as it exceeds WEBHOOK_MAX_BODY_BYTES."""
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Payload too large")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > WEBHOOK_MAX_BODY_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > WEBHOOK_MAX_BODY_BYTES:
+            raise too_large
+    return bytes(body)
 
 
 @router.post("/webhook/yookassa", status_code=status.HTTP_200_OK)
-async def yookassa_webhook(request: Request):
+async def yookassa_webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Handle YooKassa webhook notifications.
     
     YooKassa sends webhooks when payment status changes.
+    The body is validated by YooKassaWebhookRequest (422 on a malformed notification).
     """
+    # Parsed and validated in one pass from the raw bytes (no intermediate dict)
+    body = await _read_webhook_body(request)
     try:
-        data = await request.json()
-        event_type = data.get("event")
-        payment_object = data.get("object", {})
-        payment_id = payment_object.get("id")
-        payment_status = payment_object.get("status")
-        
-        if not payment_id or not payment_status:
-            logger.warning(f"Invalid webhook data: {data}")
-            return {"status": "error", "message": "Invalid webhook data"}
+        payload = YooKassaWebhookRequest.model_validate_json(body)
+    except ValidationError as e:
+        # Same 422 shape as FastAPI's own body validation
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
+    payment_object = payload.object
+    try:
+        logger.info(f"Received YooKassa webhook: event={payload.event}, payment_id={payment_object.id}, status={payment_object.status}")
+
+        # Save webhook log (written in batches, off the request path); the body is stored
+        # as received: valid JSON, no re-serialization of the parsed payload
+        webhook_log_batcher.add(
+            "yookassa",
+            f"{payload.event} {payment_object.status}".strip(),
+            body.decode("utf-8", errors="replace"),
+        )
         
-        logger.info(f"Received YooKassa webhook: event={event_type}, payment_id={payment_id}, status={payment_status}")
-
-        # Save webhook log
+        # Update payment status (PaymentService is synchronous: run it off the event loop).
+        # YooKassa sends each event of a payment once, retries repeat it: payment id + event is the key
         try:
-            db = get_db_session()
-            log = PaymentWebhookLog(
-                provider="yookassa",
-                event=f"{event_type or ''} {payment_status or ''}".strip(),
-                raw_payload=str(data),
+            updated = await run_in_threadpool(
+                PaymentService.update_payment_from_webhook,
+                payment_id=payment_object.id,
+                status=payment_object.status,
+                metadata=payment_object.metadata,
+                event_key=f"yookassa:{payment_object.id}:{payload.event}",
+                # Completion side effects (pipeline, promo, program delivery) run after the 200
+                on_completed=lambda pid: background_tasks.add_task(PaymentService.handle_payment_completed_by_id, pid),
             )
-            db.add(log)
-            db.commit()
-        except Exception:
-            pass
-        
-        # Update payment status
-        updated = PaymentService.update_payment_from_webhook(
-            payment_id=payment_id,
-            status=payment_status,
-            metadata=payment_object.get("metadata")
-        )
+        except DuplicateWebhookEvent:
+            return {"status": "ok", "duplicate": True}
         
         if updated:
             return {"status": "ok", "message": "Payment updated"}
@@ -161,9 +270,8 @@ async def yookassa_webhook(request: Request):
             return {"status": "error", "message": "Payment not found or not updated"}
             
     except Exception as e:
-        logger.error(f"Error processing YooKassa webhook: {e}")
-        import traceback
-        traceback.print_exc()
+        # One record with the traceback; loguru formats the message only if it is emitted
+        logger.exception("Error processing YooKassa webhook: {}", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing webhook: {str(e)}"
@@ -184,14 +292,14 @@ async def check_payment_status(
     """
     try:
         if payment_id:
-            payment = db.query(Payment).filter(Payment.id == payment_id).first()
+            payment = db.get(Payment, payment_id)
             if not payment:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Payment not found"
                 )
             
-            updated = PaymentService.check_payment_status(payment)
+            updated = await run_in_threadpool(PaymentService.check_payment_status, payment)
             return {
                 "status": "ok",
                 "payment_id": payment_id,
@@ -199,7 +307,7 @@ async def check_payment_status(
                 "current_status": payment.status
             }
         else:
-            updated_count = PaymentService.check_pending_payments(limit=limit)
+            updated_count = await run_in_threadpool(PaymentService.check_pending_payments, limit=limit)
             return {
                 "status": "ok",
                 "updated_count": updated_count,
@@ -217,10 +325,11 @@ async def check_payment_status(
 
 
 @router.post("/webhook/tinkoff", status_code=status.HTTP_200_OK)
-async def tinkoff_webhook(request: Request):
+async def tinkoff_webhook(request: Request, background_tasks: BackgroundTasks):
     """Handle Tinkoff notifications (JSON)."""
+    body = await _read_webhook_body(request)
     try:
-        data = await request.json()
+        data = orjson.loads(body)
         # Verify token
         if not verify_tinkoff_token(data, secret=TINKOFF_SECRET_KEY):
             logger.warning(f"Tinkoff webhook: invalid token {data}")
@@ -235,41 +344,25 @@ async def tinkoff_webhook(request: Request):
 
         internal_status = parse_tinkoff_status(status_str)
 
-        # Save webhook log
+        # Save webhook log (written in batches, off the request path)
+        webhook_log_batcher.add("tinkoff", status_str, body.decode("utf-8", errors="replace"))
         try:
-            log = PaymentWebhookLog(
-                provider="tinkoff",
-                event=status_str,
-                raw_payload=str(data),
+            updated = await run_in_threadpool(
+                PaymentService.update_payment_from_tinkoff_webhook,
+                order_id=order_id,
+                payment_id=payment_id,
+                status=internal_status,
+                event_key=f"tinkoff:{payment_id or order_id}:{status_str}",
+                # Completion side effects run after the 200, in their own session
+                on_completed=lambda pid: background_tasks.add_task(PaymentService.handle_payment_completed_by_id, pid),
             )
-            db.add(log)
-            db.commit()
-        except Exception:
-            pass
-        db = get_db_session()
-        updated = 0
-        try:
-            payment = db.query(Payment).filter(Payment.id == int(order_id)).first()
-            if not payment:
-                logger.warning(f"Tinkoff webhook: payment {order_id} not found")
-                return {"status": "error", "message": "Payment not found"}
-            old = payment.status
-            payment.payment_id = payment_id or payment.payment_id
-            payment.status = internal_status
-            if internal_status == "completed" and old != "completed":
-                payment.completed_at = datetime.utcnow()
-                PaymentService._handle_payment_completed(db, payment)
-            db.commit()
-            updated = 1
-        except Exception as e:
-            logger.error(f"Tinkoff webhook error: {e}")
-            db.rollback()
-            return {"status": "error", "message": "Exception"}
-        finally:
-            db.close()
-        return {"status": "ok", "updated": updated}
+        except DuplicateWebhookEvent:
+            return {"status": "ok", "duplicate": True}
+        if not updated:
+            return {"status": "error", "message": "Payment not found"}
+        return {"status": "ok", "updated": 1}
     except Exception as e:
-        logger.error(f"Tinkoff webhook exception: {e}")
+        logger.exception("Tinkoff webhook exception: {}", e)
         return {"status": "error", "message": "Exception"}
 
 
@@ -338,47 +431,22 @@ async def payments_health(
 @router.get("/{payment_id}", status_code=status.HTTP_200_OK)
 async def get_payment(
     payment_id: int,
-    db: Session = Depends(get_db_session)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get payment details."""
-    payment = db.query(Payment).filter(Payment.id == payment_id).first()
+    payment = (
+        await db.execute(_SELECT_PAYMENT_DETAIL, {"payment_id": payment_id})
+    ).mappings().first()
     if not payment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Payment not found"
         )
 
-    return {
-        "id": payment.id,
-        "client_id": payment.client_id,
-        "amount": payment.amount,
-        "currency": payment.currency,
-        "payment_type": payment.payment_type,
-        "status": payment.status,
-        "payment_method": payment.payment_method,
-        "payment_id": payment.payment_id,
-        "promo_code": payment.promo_code,
-        "discount_amount": payment.discount_amount,
-        "final_amount": payment.final_amount,
-        "created_at": payment.created_at.isoformat() if payment.created_at else None,
-        "completed_at": payment.completed_at.isoformat() if payment.completed_at else None,
-    }
+    return ORJSONResponse(dict(payment))
 
 
 @router.get("/webhooks/logs", status_code=status.HTTP_200_OK)
-async def get_webhook_logs(limit: int = 50, db: Session = Depends(get_db_session)):
-    rows = (
-        db.query(PaymentWebhookLog)
-        .order_by(PaymentWebhookLog.created_at.desc())
-        .limit(max(1, min(200, limit)))
-        .all()
-    )
-    return [
-        {
-            "id": r.id,
-            "provider": r.provider,
-            "event": r.event,
-            "created_at": r.created_at.isoformat() if r.created_at else None,
-        }
-        for r in rows
-    ]
+async def get_webhook_logs(limit: int = 50, db: AsyncSession = Depends(get_async_db)):
+    rows = await db.execute(_SELECT_WEBHOOK_LOGS, {"limit": max(1, min(200, limit))})
+    return ORJSONResponse([dict(r) for r in rows.mappings()])
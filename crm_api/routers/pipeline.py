@@ -1,9 +1,11 @@
 """Pipeline router."""
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import bindparam, exists, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from pydantic import BaseModel
-from database.db import get_db_session
+from pydantic import BaseModel, Field
+from database.db import get_async_db
 from database.models_crm import PipelineStage, ClientPipeline, User
 from database.models import Client
 from crm_api.dependencies import get_current_user
@@ -25,36 +27,66 @@ class PipelineStageResponse(BaseModel):
         from_attributes = True
 
 
+# Stage lists are read as plain rows and returned without re-validating them through the model
+STAGE_LIST_COLUMNS = tuple(getattr(PipelineStage, field) for field in PipelineStageResponse.model_fields)
+
+# Built once so every request reuses the same statement (and its compiled SQL)
+_SELECT_ALL_STAGES = select(*STAGE_LIST_COLUMNS).order_by(PipelineStage.order)
+_SELECT_ACTIVE_STAGES = (
+    select(*STAGE_LIST_COLUMNS).where(PipelineStage.is_active == True).order_by(PipelineStage.order)
+)
+_SELECT_CLIENT_EXISTS = select(Client.id).where(Client.id == bindparam("client_id"))
+# Stage name/color come from the same query (outer join: the stage may have been deleted)
+_SELECT_CLIENT_HISTORY = (
+    select(
+        ClientPipeline.id,
+        ClientPipeline.stage_id,
+        ClientPipeline.moved_at,
+        ClientPipeline.moved_by,
+        ClientPipeline.notes,
+        PipelineStage.name.label("stage_name"),
+        PipelineStage.color.label("stage_color"),
+    )
+    .outerjoin(PipelineStage, PipelineStage.id == ClientPipeline.stage_id)
+    .where(ClientPipeline.client_id == bindparam("client_id"))
+    .order_by(ClientPipeline.moved_at.desc())
+)
+
+
 class MoveClientRequest(BaseModel):
     stage_id: int
     notes: str | None = None
 
 
+class BulkMoveClientsRequest(BaseModel):
+    client_ids: List[int] = Field(..., min_length=1, max_length=500)
+    stage_id: int
+    notes: str | None = None
+
+
 @router.get("/stages", response_model=List[PipelineStageResponse])
 async def get_pipeline_stages(
     include_inactive: bool = Query(False, description="Include inactive stages"),
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all pipeline stages."""
-    query = db.query(PipelineStage)
-    if not include_inactive:
-        query = query.filter(PipelineStage.is_active == True)
-    stages = query.order_by(PipelineStage.order).all()
-    return stages
+    stmt = _SELECT_ALL_STAGES if include_inactive else _SELECT_ACTIVE_STAGES
+    stages = (await db.execute(stmt)).mappings()
+    return ORJSONResponse([dict(row) for row in stages])
 
 
 @router.post("/stages", response_model=PipelineStageResponse)
 async def create_pipeline_stage(
     stage_data: dict,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create new pipeline stage."""
     stage = PipelineStage(**stage_data)
     db.add(stage)
-    db.commit()
-    db.refresh(stage)
+    await db.commit()
+    await db.refresh(stage)
     return stage
 
 
@@ -62,11 +94,11 @@ async def create_pipeline_stage(
 async def update_pipeline_stage(
     stage_id: int,
     stage_data: dict,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update pipeline stage."""
-    stage = db.query(PipelineStage).filter(PipelineStage.id == stage_id).first()
+    stage = await db.get(PipelineStage, stage_id)
     if not stage:
         raise HTTPException(status_code=404, detail="Pipeline stage not found")
     
@@ -76,58 +108,59 @@ async def update_pipeline_stage(
         if field in allowed_fields and hasattr(stage, field):
             setattr(stage, field, value)
     
-    db.commit()
-    db.refresh(stage)
+    await db.commit()
+    await db.refresh(stage)
     return stage
 
 
 @router.delete("/stages/{stage_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_pipeline_stage(
     stage_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete pipeline stage."""
-    stage = db.query(PipelineStage).filter(PipelineStage.id == stage_id).first()
+    stage = await db.get(PipelineStage, stage_id)
     if not stage:
         raise HTTPException(status_code=404, detail="Pipeline stage not found")
     
-    # Check if there are clients on this stage
-    clients_count = db.query(Client).filter(Client.pipeline_stage_id == stage_id).count()
-    if clients_count > 0:
+    # Check if there are clients on this stage (EXISTS stops at the first one;
+    # the count for the message is only taken when deletion is refused)
+    has_clients = await db.scalar(select(exists().where(Client.pipeline_stage_id == stage_id)))
+    if has_clients:
+        clients_count = await db.scalar(
+            select(func.count()).select_from(Client).where(Client.pipeline_stage_id == stage_id)
+        )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Cannot delete stage with {clients_count} clients. Move clients first."
         )
     
-    db.delete(stage)
-    db.commit()
+    await db.delete(stage)
+    await db.commit()
     return None
 
 
 @router.get("/clients/{client_id}/history")
 async def get_client_pipeline_history(
     client_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get client's pipeline movement history."""
-    client = db.query(Client).filter(Client.id == client_id).first()
-    if not client:
+    client_exists = await db.scalar(_SELECT_CLIENT_EXISTS, {"client_id": client_id})
+    if client_exists is None:
         raise HTTPException(status_code=404, detail="Client not found")
     
-    history = db.query(ClientPipeline).filter(
-        ClientPipeline.client_id == client_id
-    ).order_by(ClientPipeline.moved_at.desc()).all()
+    history = await db.execute(_SELECT_CLIENT_HISTORY, {"client_id": client_id})
     
     result = []
     for entry in history:
-        stage = db.query(PipelineStage).filter(PipelineStage.id == entry.stage_id).first()
         result.append({
             "id": entry.id,
             "stage_id": entry.stage_id,
-            "stage_name": stage.name if stage else "Unknown",
-            "stage_color": stage.color if stage else "#000000",
+            "stage_name": entry.stage_name if entry.stage_name is not None else "Unknown",
+            "stage_color": entry.stage_color if entry.stage_name is not None else "#000000",
             "moved_at": entry.moved_at.isoformat() if entry.moved_at else None,
             "moved_by": entry.moved_by,
             "notes": entry.notes,
@@ -140,15 +173,15 @@ async def get_client_pipeline_history(
 async def move_client_to_stage(
     client_id: int,
     request: MoveClientRequest,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Move client to different pipeline stage."""
-    client = db.query(Client).filter(Client.id == client_id).first()
+    client = await db.get(Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     
-    stage = db.query(PipelineStage).filter(PipelineStage.id == request.stage_id).first()
+    stage = await db.get(PipelineStage, request.stage_id)
     if not stage:
         raise HTTPException(status_code=404, detail="Pipeline stage not found")
     
@@ -164,7 +197,52 @@ async def move_client_to_stage(
         moved_at=datetime.utcnow()
     )
     db.add(pipeline_entry)
-    db.commit()
+    await db.commit()
     
     return {"message": "Client moved to stage successfully", "stage_id": request.stage_id}
 
+
+@router.post("/clients/move-stage/bulk")
+async def move_clients_to_stage_bulk(
+    request: BulkMoveClientsRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Move several clients to a pipeline stage at once (e.g. multi-card drag on the board)."""
+    stage = await db.get(PipelineStage, request.stage_id)
+    if not stage:
+        raise HTTPException(status_code=404, detail="Pipeline stage not found")
+    
+    requested_ids = list(dict.fromkeys(request.client_ids))
+    client_ids = (await db.scalars(select(Client.id).where(Client.id.in_(requested_ids)))).all()
+    if client_ids:
+        # One UPDATE for all clients and one multi-row INSERT for their history entries
+        await db.execute(
+            update(Client)
+            .where(Client.id.in_(client_ids))
+            .values(pipeline_stage_id=request.stage_id)
+            .execution_options(synchronize_session=False)
+        )
+        moved_at = datetime.utcnow()
+        await db.execute(
+            insert(ClientPipeline),
+            [
+                {
+                    "client_id": client_id,
+                    "stage_id": request.stage_id,
+                    "moved_by": current_user.id,
+                    "notes": request.notes,
+                    "moved_at": moved_at,
+                }
+                for client_id in client_ids
+            ],
+        )
+        await db.commit()
+    
+    found = set(client_ids)
+    return {
+        "message": "Clients moved to stage successfully",
+        "stage_id": request.stage_id,
+        "moved": len(client_ids),
+        "not_found": [client_id for client_id in requested_ids if client_id not in found],
+    }
@@ -1,15 +1,17 @@
 """Program templates router - CRUD operations for program templates."""
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from database.db import get_db_session
+from database.db import get_async_db
 from database.models_crm import ProgramTemplate, User
 from crm_api.dependencies import get_current_user
-from pydantic import BaseModel
+from services.response_cache import default_template_cache
+from pydantic import BaseModel, TypeAdapter
 from loguru import logger
 from datetime import datetime
 from typing import List, Optional
-import json
 
 router = APIRouter()
 
@@ -59,110 +61,101 @@ class ProgramTemplateResponse(BaseModel):
         }
 
 
+_TEMPLATE_LIST_ADAPTER = TypeAdapter(List[ProgramTemplateResponse])
+
+
+async def _unset_default(db: AsyncSession, template_type: str, keep_id: Optional[int] = None) -> None:
+    """Снять флаг по умолчанию с других шаблонов типа (в транзакции вызывающего).
+
+    Обновляется только текущий шаблон по умолчанию, а не все шаблоны типа. Выполняется до flush
+    изменений вызывающего: уникальный индекс ux_program_templates_default проверяется построчно.
+    """
+    stmt = update(ProgramTemplate).where(
+        ProgramTemplate.template_type == template_type,
+        ProgramTemplate.is_default == True,
+    )
+    if keep_id is not None:
+        stmt = stmt.where(ProgramTemplate.id != keep_id)
+    with db.no_autoflush:
+        await db.execute(stmt.values(is_default=False).execution_options(synchronize_session=False))
+
+
+async def _commit_template(db: AsyncSession) -> None:
+    """Сохранить изменения; второй активный шаблон по умолчанию того же типа — 409."""
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Для этого типа уже есть активный шаблон по умолчанию"
+        )
+    await default_template_cache.clear()
+
+
 @router.get("/", response_model=List[ProgramTemplateResponse])
 async def get_templates(
     template_type: Optional[str] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получить список шаблонов."""
-    query = db.query(ProgramTemplate)
+    query = select(ProgramTemplate)
     
     if template_type:
-        query = query.filter(ProgramTemplate.template_type == template_type)
+        query = query.where(ProgramTemplate.template_type == template_type)
     if is_active is not None:
-        query = query.filter(ProgramTemplate.is_active == is_active)
+        query = query.where(ProgramTemplate.is_active == is_active)
     
-    templates = query.order_by(ProgramTemplate.created_at.desc()).all()
-    
-    # Parse placeholders JSON for each template and return as response models
-    result = []
-    for template in templates:
-        template_dict = {
-            "id": template.id,
-            "name": template.name,
-            "template_type": template.template_type,
-            "content": template.content,
-            "description": template.description,
-            "placeholders": json.loads(template.placeholders) if template.placeholders else None,
-            "is_active": template.is_active,
-            "is_default": template.is_default,
-            "created_at": template.created_at,
-            "updated_at": template.updated_at,
-            "created_by": template.created_by,
-            "updated_by": template.updated_by
-        }
-        result.append(ProgramTemplateResponse(**template_dict))
+    templates = (await db.scalars(query.order_by(ProgramTemplate.created_at.desc()))).all()
     
-    return result
+    # Validated straight from the ORM rows (from_attributes), one pass for the whole list
+    return _TEMPLATE_LIST_ADAPTER.validate_python(templates, from_attributes=True)
 
 
 @router.get("/{template_id}", response_model=ProgramTemplateResponse)
 async def get_template(
     template_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получить шаблон по ID."""
-    template = db.query(ProgramTemplate).filter(ProgramTemplate.id == template_id).first()
+    template = await db.get(ProgramTemplate, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Шаблон не найден")
     
-    template_dict = {
-        "id": template.id,
-        "name": template.name,
-        "template_type": template.template_type,
-        "content": template.content,
-        "description": template.description,
-        "placeholders": json.loads(template.placeholders) if template.placeholders else None,
-        "is_active": template.is_active,
-        "is_default": template.is_default,
-        "created_at": template.created_at,
-        "updated_at": template.updated_at,
-        "created_by": template.created_by,
-        "updated_by": template.updated_by
-    }
-    return ProgramTemplateResponse(**template_dict)
+    return ProgramTemplateResponse.model_validate(template)
 
 
 @router.get("/default/{template_type}", response_model=ProgramTemplateResponse)
 async def get_default_template(
     template_type: str,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получить шаблон по умолчанию для указанного типа."""
-    template = db.query(ProgramTemplate).filter(
+    cached = await default_template_cache.get(template_type)
+    if cached is not None:
+        return cached
+    template = await db.scalar(select(ProgramTemplate).where(
         ProgramTemplate.template_type == template_type,
         ProgramTemplate.is_default == True,
         ProgramTemplate.is_active == True
-    ).first()
+    ))
     
     if not template:
         raise HTTPException(status_code=404, detail=f"Шаблон по умолчанию для типа '{template_type}' не найден")
     
-    template_dict = {
-        "id": template.id,
-        "name": template.name,
-        "template_type": template.template_type,
-        "content": template.content,
-        "description": template.description,
-        "placeholders": json.loads(template.placeholders) if template.placeholders else None,
-        "is_active": template.is_active,
-        "is_default": template.is_default,
-        "created_at": template.created_at,
-        "updated_at": template.updated_at,
-        "created_by": template.created_by,
-        "updated_by": template.updated_by
-    }
-    return ProgramTemplateResponse(**template_dict)
+    result = ProgramTemplateResponse.model_validate(template)
+    await default_template_cache.set(template_type, result.model_dump(mode="json"))
+    return result
 
 
 @router.post("/", response_model=ProgramTemplateResponse, status_code=status.HTTP_201_CREATED)
 async def create_template(
     template_data: ProgramTemplateCreate,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Создать новый шаблон."""
@@ -172,56 +165,36 @@ async def create_template(
     
     # Если устанавливается как шаблон по умолчанию, снять флаг с других шаблонов того же типа
     if template_data.is_default:
-        db.query(ProgramTemplate).filter(
-            ProgramTemplate.template_type == template_data.template_type
-        ).update({"is_default": False})
-    
-    # Преобразовать placeholders в JSON строку
-    placeholders_json = json.dumps(template_data.placeholders, ensure_ascii=False) if template_data.placeholders else None
+        await _unset_default(db, template_data.template_type)
     
     template = ProgramTemplate(
         name=template_data.name,
         template_type=template_data.template_type,
         content=template_data.content,
         description=template_data.description,
-        placeholders=placeholders_json,
+        placeholders=template_data.placeholders or None,
         is_active=template_data.is_active,
         is_default=template_data.is_default,
         created_by=current_user.id
     )
     
     db.add(template)
-    db.commit()
-    db.refresh(template)
+    await _commit_template(db)
     
     logger.info(f"Created program template: {template.id} - {template.name} by user {current_user.id}")
     
-    template_dict = {
-        "id": template.id,
-        "name": template.name,
-        "template_type": template.template_type,
-        "content": template.content,
-        "description": template.description,
-        "placeholders": json.loads(template.placeholders) if template.placeholders else None,
-        "is_active": template.is_active,
-        "is_default": template.is_default,
-        "created_at": template.created_at,
-        "updated_at": template.updated_at,
-        "created_by": template.created_by,
-        "updated_by": template.updated_by
-    }
-    return ProgramTemplateResponse(**template_dict)
+    return ProgramTemplateResponse.model_validate(template)
 
 
 @router.put("/{template_id}", response_model=ProgramTemplateResponse)
 async def update_template(
     template_id: int,
     template_data: ProgramTemplateUpdate,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Обновить шаблон."""
-    template = db.query(ProgramTemplate).filter(ProgramTemplate.id == template_id).first()
+    template = await db.get(ProgramTemplate, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Шаблон не найден")
     
@@ -237,51 +210,33 @@ async def update_template(
     if template_data.description is not None:
         template.description = template_data.description
     if template_data.placeholders is not None:
-        template.placeholders = json.dumps(template_data.placeholders, ensure_ascii=False) if template_data.placeholders else None
+        template.placeholders = template_data.placeholders or None
     if template_data.is_active is not None:
         template.is_active = template_data.is_active
     if template_data.is_default is not None:
         template.is_default = template_data.is_default
         # Если устанавливается как шаблон по умолчанию, снять флаг с других шаблонов того же типа
         if template_data.is_default:
-            db.query(ProgramTemplate).filter(
-                ProgramTemplate.template_type == template.template_type,
-                ProgramTemplate.id != template_id
-            ).update({"is_default": False})
+            await _unset_default(db, template.template_type, keep_id=template_id)
     
     template.updated_by = current_user.id
     template.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(template)
+    await _commit_template(db)
     
     logger.info(f"Updated program template: {template.id} - {template.name} by user {current_user.id}")
     
-    template_dict = {
-        "id": template.id,
-        "name": template.name,
-        "template_type": template.template_type,
-        "content": template.content,
-        "description": template.description,
-        "placeholders": json.loads(template.placeholders) if template.placeholders else None,
-        "is_active": template.is_active,
-        "is_default": template.is_default,
-        "created_at": template.created_at,
-        "updated_at": template.updated_at,
-        "created_by": template.created_by,
-        "updated_by": template.updated_by
-    }
-    return ProgramTemplateResponse(**template_dict)
+    return ProgramTemplateResponse.model_validate(template)
 
 
 @router.delete("/{template_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_template(
     template_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Удалить шаблон."""
-    template = db.query(ProgramTemplate).filter(ProgramTemplate.id == template_id).first()
+    template = await db.get(ProgramTemplate, template_id)
     if not template:
         raise HTTPException(status_code=404, detail="Шаблон не найден")
     
@@ -289,8 +244,8 @@ async def delete_template(
     if template.is_default:
         raise HTTPException(status_code=400, detail="Нельзя удалить шаблон по умолчанию. Сначала установите другой шаблон как шаблон по умолчанию.")
     
-    db.delete(template)
-    db.commit()
+    await db.delete(template)
+    await db.commit()
     
     logger.info(f"Deleted program template: {template_id} - {template.name} by user {current_user.id}")
     return None
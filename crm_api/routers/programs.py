@@ -1,12 +1,14 @@
 """Programs router."""
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
 from typing import List
-from database.db import get_db_session
+from database.db import get_async_db
 from database.models import TrainingProgram, Client, ProgramVersion
 from database.models_crm import User
 from crm_api.dependencies import get_current_user
-import json
 import os
 import shutil
 from datetime import datetime
@@ -21,6 +23,18 @@ from services.program_cleanup import ProgramCleanupService
 
 router = APIRouter()
 
+# The program list selects only these columns (no program_data document) and returns the rows as-is
+PROGRAM_LIST_COLUMNS = (
+    TrainingProgram.id,
+    TrainingProgram.client_id,
+    TrainingProgram.program_type,
+    TrainingProgram.formatted_program,
+    TrainingProgram.is_paid,
+    TrainingProgram.is_completed,
+    TrainingProgram.created_at,
+    TrainingProgram.assigned_at,
+)
+
 
 # Cleanup models
 class CleanupRequest(BaseModel):
@@ -49,14 +63,14 @@ class AutoGenerateRequest(BaseModel):
 @router.post("/auto-generate", status_code=status.HTTP_201_CREATED)
 async def auto_generate_program(
     payload: AutoGenerateRequest,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Auto-generate a full personalized training program for a client.
     Uses stored client profile (age, gender, experience, goals, location) and generator.
     """
-    client = db.query(Client).filter(Client.id == payload.client_id).first()
+    client = await db.get(Client, payload.client_id)
     if not client:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
 
@@ -123,7 +137,7 @@ async def auto_generate_program(
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save program")
         
         # Get saved program for response
-        saved_program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+        saved_program = await db.get(TrainingProgram, program_id)
         if not saved_program:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Program saved but not found")
 
@@ -146,61 +160,38 @@ async def auto_generate_program(
 async def get_programs(
     client_id: int | None = None,
     is_paid: bool | None = None,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get list of training programs."""
-    query = db.query(TrainingProgram)
+    query = select(*PROGRAM_LIST_COLUMNS)
     
     if client_id:
-        query = query.filter(TrainingProgram.client_id == client_id)
+        query = query.where(TrainingProgram.client_id == client_id)
     if is_paid is not None:
-        query = query.filter(TrainingProgram.is_paid == is_paid)
-    
-    programs = query.order_by(TrainingProgram.created_at.desc()).all()
-    
-    result = []
-    for program in programs:
-        try:
-            program_data = json.loads(program.program_data) if program.program_data else {}
-        except:
-            program_data = {}
-        
-        result.append({
-            "id": program.id,
-            "client_id": program.client_id,
-            "program_type": program.program_type,
-            "formatted_program": program.formatted_program,
-            "is_paid": program.is_paid,
-            "is_completed": program.is_completed,
-            "created_at": program.created_at.isoformat() if program.created_at else None,
-            "assigned_at": program.assigned_at.isoformat() if program.assigned_at else None,
-        })
+        query = query.where(TrainingProgram.is_paid == is_paid)
     
-    return result
+    rows = await db.execute(query.order_by(TrainingProgram.created_at.desc()))
+    # orjson writes datetimes as ISO 8601, no per-field isoformat()
+    return ORJSONResponse([dict(row) for row in rows.mappings()])
 
 
 @router.get("/{program_id}")
 async def get_program(
     program_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get program details."""
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+    program = await db.get(TrainingProgram, program_id)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
-    try:
-        program_data = json.loads(program.program_data) if program.program_data else {}
-    except:
-        program_data = {}
-    
     return {
         "id": program.id,
         "client_id": program.client_id,
         "program_type": program.program_type,
-        "program_data": program_data,
+        "program_data": program.program_data or {},
         "formatted_program": program.formatted_program,
         "is_paid": program.is_paid,
         "is_completed": program.is_completed,
@@ -212,11 +203,11 @@ async def get_program(
 @router.get("/{program_id}/view")
 async def view_program_table(
     program_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """View program in table format (for CRM display)."""
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+    program = await db.get(TrainingProgram, program_id)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
@@ -232,11 +223,14 @@ async def view_program_table(
 async def update_program(
     program_id: int,
     update_data: dict,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update program."""
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+    # program_data that is about to be replaced is not loaded (and decoded) first;
+    # the response then returns the new value as received
+    options = [defer(TrainingProgram.program_data)] if "program_data" in update_data else None
+    program = await db.get(TrainingProgram, program_id, options=options)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
@@ -247,22 +241,16 @@ async def update_program(
         program.is_completed = update_data["is_completed"]
     if "program_data" in update_data:
         # Update program_data (the structured JSON data)
-        program.program_data = json.dumps(update_data["program_data"], ensure_ascii=False)
+        program.program_data = update_data["program_data"]
     
-    db.commit()
-    db.refresh(program)
+    await db.commit()
     
     # Return updated program
-    try:
-        program_data = json.loads(program.program_data) if program.program_data else {}
-    except:
-        program_data = {}
-    
     return {
         "id": program.id,
         "client_id": program.client_id,
         "program_type": program.program_type,
-        "program_data": program_data,
+        "program_data": program.program_data or {},
         "formatted_program": program.formatted_program,
         "is_paid": program.is_paid,
         "is_completed": program.is_completed,
@@ -272,15 +260,16 @@ async def update_program(
 @router.get("/{program_id}/versions")
 async def list_versions(
     program_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     versions = (
-        db.query(ProgramVersion)
-        .filter(ProgramVersion.program_id == program_id)
-        .order_by(ProgramVersion.created_at.desc())
-        .all()
-    )
+        await db.scalars(
+            select(ProgramVersion)
+            .where(ProgramVersion.program_id == program_id)
+            .order_by(ProgramVersion.created_at.desc())
+        )
+    ).all()
     return [
         {
             "id": v.id,
@@ -294,10 +283,10 @@ async def list_versions(
 @router.post("/{program_id}/versions", status_code=status.HTTP_201_CREATED)
 async def create_version_snapshot(
     program_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+    program = await db.get(TrainingProgram, program_id)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     snapshot = ProgramVersion(
@@ -307,42 +296,41 @@ async def create_version_snapshot(
         created_by=current_user.id if current_user else None,
     )
     db.add(snapshot)
-    db.commit()
-    db.refresh(snapshot)
+    await db.commit()
     return {"id": snapshot.id, "created_at": snapshot.created_at.isoformat() if snapshot.created_at else None}
 
 
 @router.post("/versions/{version_id}/restore", status_code=status.HTTP_200_OK)
 async def restore_version(
     version_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    version = db.query(ProgramVersion).filter(ProgramVersion.id == version_id).first()
+    version = await db.get(ProgramVersion, version_id)
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == version.program_id).first()
+    program = await db.get(TrainingProgram, version.program_id)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     program.program_data = version.program_data
     program.formatted_program = version.formatted_program
-    db.commit()
+    await db.commit()
     return {"success": True}
 
 
 @router.get("/{program_id}/export-pdf")
 async def export_pdf(
     program_id: int,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Export program as PDF."""
     from loguru import logger
     try:
-        program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+        program = await db.get(TrainingProgram, program_id)
         if not program:
             raise HTTPException(status_code=404, detail="Program not found")
-        client = db.query(Client).filter(Client.id == program.client_id).first()
+        client = await db.get(Client, program.client_id)
         if not client:
             raise HTTPException(status_code=404, detail="Client not found")
         if not program.formatted_program:
@@ -356,13 +344,9 @@ async def export_pdf(
         logger.info(f"Generating PDF for program {program_id}, client {client.id}, text length: {len(program.formatted_program)} chars")
         
         # Try to use structured program_data for better PDF generation
-        program_data_json = None
-        if program.program_data:
-            try:
-                program_data_json = json.loads(program.program_data)
-                logger.info(f"Loaded program_data JSON with {len(program_data_json.get('weeks', {}))} weeks")
-            except Exception as e:
-                logger.warning(f"Could not parse program_data JSON: {e}, using formatted_program only")
+        program_data_json = program.program_data or None
+        if isinstance(program_data_json, dict):
+            logger.info(f"Loaded program_data JSON with {len(program_data_json.get('weeks', {}))} weeks")
         
         # Get trainer info from environment
         trainer_info = {
@@ -376,11 +360,11 @@ async def export_pdf(
         footer_template = None
         try:
             from database.models_crm import ProgramTemplate
-            template = db.query(ProgramTemplate).filter(
+            template = await db.scalar(select(ProgramTemplate).where(
                 ProgramTemplate.template_type == "footer",
                 ProgramTemplate.is_default == True,
                 ProgramTemplate.is_active == True
-            ).first()
+            ))
             
             if template:
                 # Replace placeholders in template content
@@ -507,13 +491,13 @@ class SendProgramRequest(BaseModel):
 async def send_program(
     program_id: int,
     payload: SendProgramRequest,
-    db: Session = Depends(get_db_session),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
+    program = await db.get(TrainingProgram, program_id)
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
-    client = db.query(Client).filter(Client.id == program.client_id).first()
+    client = await db.get(Client, program.client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
     if not program.formatted_program:
@@ -541,7 +525,7 @@ async def send_program(
     if any(r.get("success") for r in results.values() if isinstance(r, dict)):
         if not program.sent_at:
             program.sent_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
             logger.info(f"Marked program {program_id} as sent after delivery")
     
     return {"results": results}
@@ -1,5 +1,5 @@
 """Database package."""
 from .models import Base, Client, TrainingProgram, Payment, Lead
-from .db import init_db, get_db, get_db_session
+from .db import init_db, get_db, get_db_session, get_async_db
 
-__all__ = ['Base', 'Client', 'TrainingProgram', 'Payment', 'Lead', 'init_db', 'get_db', 'get_db_session']
+__all__ = ['Base', 'Client', 'TrainingProgram', 'Payment', 'Lead', 'init_db', 'get_db', 'get_db_session', 'get_async_db']
@@ -1,26 +1,75 @@
 """Database initialization and session management."""
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import StaticPool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import AsyncIterator
 from config import DATABASE_URL
 from database.models import Base
 from database import models_crm  # noqa: F401
+import orjson
 import os
 
+# Compiled SQL cache entries per engine (SQLAlchemy default is 500); the API
+# has many distinct statements and a miss means recompiling the SQL
+QUERY_CACHE_SIZE = 1200
+
+
+def _json_serializer(value) -> str:
+    # Non-str keys are stringified, as json.dumps did
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# JSON/JSONB columns (campaign params, audience filters) are encoded/decoded with orjson
+ENGINE_JSON_OPTIONS = {"json_serializer": _json_serializer, "json_deserializer": orjson.loads}
+
 # Create database engine
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool
+        poolclass=StaticPool,
+        query_cache_size=QUERY_CACHE_SIZE,
+        **ENGINE_JSON_OPTIONS,
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, query_cache_size=QUERY_CACHE_SIZE, **ENGINE_JSON_OPTIONS)
+
+# INSERT ... ON CONFLICT is dialect-specific; both dialects share the on_conflict_do_update API
+dialect_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _async_database_url(url: str) -> str:
+    """Map sync DATABASE_URL to the matching asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite+aiosqlite") or url.startswith("postgresql+asyncpg"):
+        return url
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite" + url[url.index(":"):]
+    if url.startswith(("postgresql", "postgres")):
+        return "postgresql+asyncpg" + url[url.index(":"):]
+    return url
+
+
+# Async engine for endpoints that must not block the event loop
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, query_cache_size=QUERY_CACHE_SIZE, **ENGINE_JSON_OPTIONS)
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=True,
+        query_cache_size=QUERY_CACHE_SIZE,
+        **ENGINE_JSON_OPTIONS,
+    )
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
 def init_db():
     """Initialize database - create all tables."""
     Base.metadata.create_all(bind=engine)
@@ -40,6 +89,12 @@ def get_db_session() -> Session:
     return SessionLocal()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Get async database session (FastAPI dependency)."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # Initialize database on import
 if __name__ != "__main__":
     init_db()
@@ -5,6 +5,7 @@ from pathlib import Path
 # Add parent directory to path to allow imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from config import BCRYPT_ROUNDS
 from database.db import get_db_session, engine
 from database.models import Base
 from database.models_crm import (
@@ -89,6 +90,30 @@ def ensure_optional_columns():
                     logger.error(f"Failed to add column {table}.{column}: {e}")
                     raise
 
+        def ensure_jsonb(table: str, column: str):
+            """PostgreSQL: convert a legacy TEXT column holding JSON to JSONB (SQLite keeps TEXT)."""
+            if engine.dialect.name != "postgresql" or not table_exists(table):
+                return
+            column_type = next(
+                (col["type"] for col in inspector.get_columns(table) if col["name"] == column), None
+            )
+            if column_type is None or column_type.__class__.__name__ == "JSONB":
+                return
+            logger.info(f"Converting {table}.{column} to JSONB")
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"))
+
+        def ensure_index(table: str, index_name: str):
+            """Create an index declared on the model if the existing table lacks it."""
+            if not table_exists(table):
+                return
+            existing = {idx["name"] for idx in inspector.get_indexes(table)}
+            if index_name in existing:
+                return
+            index = next(idx for idx in Base.metadata.tables[table].indexes if idx.name == index_name)
+            logger.info(f"Creating missing index {table}.{index_name}")
+            index.create(bind=engine, checkfirst=True)
+
         logger.info("Ensuring clients.email column...")
         ensure("clients", "email", "VARCHAR(255)")
         logger.info("clients.email check completed")
@@ -145,6 +170,60 @@ def ensure_optional_columns():
             ensure("training_programs", "sent_at", "DATETIME")
             logger.info("training_programs.sent_at check completed")
         
+        # Ensure reminders.priority column (priority queue for reminder processing)
+        ensure("reminders", "priority", "INTEGER NOT NULL DEFAULT 0")
+        
+        # Marketing JSON documents are stored as JSONB on PostgreSQL
+        ensure_jsonb("marketing_campaigns", "params")
+        ensure_jsonb("campaign_audiences", "filter_json")
+        # Pipelines, templates and program documents likewise
+        ensure_jsonb("sales_pipelines", "params")
+        ensure_jsonb("program_templates", "placeholders")
+        ensure_jsonb("training_programs", "program_data")
+        ensure_jsonb("program_versions", "program_data")
+        ensure_jsonb("program_history", "program_data")
+        
+        # Indexes for analytics filters and per-client history
+        ensure_index("payments", "ix_payments_status_completed_at")
+        ensure_index("clients", "ix_clients_pipeline_stage")
+        ensure_index("payments", "ix_payments_client_created")
+        ensure_index("client_pipelines", "ix_client_pipelines_client_moved")
+        ensure_index("client_contacts", "ix_contacts_client_created")
+        ensure_index("campaign_deliveries", "ix_campaign_delivery_campaign_created")
+        ensure_index("campaign_runs", "ix_campaign_run_campaign_started")
+        ensure_index("client_actions", "ix_client_action_client_type")
+        ensure_index("payment_webhook_logs", "ix_payment_webhook_logs_created")
+        ensure_index("website_settings", "ix_website_settings_category_key")
+        ensure_index("pipeline_stages", "ix_pipeline_stages_active_order")
+        
+        # Preferences are upserted by client_id: drop duplicate rows (keep the latest) before the unique index
+        if table_exists("client_channel_preferences") and "ux_client_channel_pref_client" not in {
+            idx["name"] for idx in inspector.get_indexes("client_channel_preferences")
+        }:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "DELETE FROM client_channel_preferences WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM client_channel_preferences GROUP BY client_id)"
+                ))
+        ensure_index("client_channel_preferences", "ux_client_channel_pref_client")
+        
+        ensure_index("program_templates", "ix_program_templates_type_active_created")
+        ensure_index("training_programs", "ix_training_programs_client_paid_created")
+        # One active default template per type: keep the latest one before the unique index
+        if table_exists("program_templates") and "ux_program_templates_default" not in {
+            idx["name"] for idx in inspector.get_indexes("program_templates")
+        }:
+            with engine.begin() as conn:
+                conn.execute(
+                    text(
+                        "UPDATE program_templates SET is_default = :off "
+                        "WHERE is_default AND is_active AND id NOT IN "
+                        "(SELECT MAX(id) FROM program_templates WHERE is_default AND is_active GROUP BY template_type)"
+                    ),
+                    {"off": False},
+                )
+        ensure_index("program_templates", "ux_program_templates_default")
+        
         logger.info("ensure_optional_columns() completed successfully")
             
     except Exception as e:
@@ -208,7 +287,7 @@ def create_default_admin_user():
         ).first()
 
         # Hash password from env
-        password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
         if admin:
             updates = []
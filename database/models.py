@@ -1,11 +1,15 @@
 """Database models for the fitness trainer bot."""
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+# JSON-документ: TEXT в SQLite, JSONB в PostgreSQL; в Python всегда dict (None хранится как NULL)
+JSONDocument = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
 
 class Client(Base):
     """Client model - stores information about users."""
@@ -50,6 +54,11 @@ class Client(Base):
     reminders = relationship("Reminder", back_populates="client", foreign_keys="[Reminder.client_id]")
     bot_links = relationship("ClientBotLink", back_populates="client", foreign_keys="[ClientBotLink.client_id]")
 
+    __table_args__ = (
+        # Воронка: подсчёт клиентов по этапам
+        Index("ix_clients_pipeline_stage", "pipeline_stage_id"),
+    )
+
 
 class TrainingProgram(Base):
     """Training program model - stores generated training programs."""
@@ -58,7 +67,7 @@ class TrainingProgram(Base):
     id = Column(Integer, primary_key=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     program_type = Column(String(50))  # free_demo, paid_monthly, paid_3month
-    program_data = Column(Text)  # JSON string with program details
+    program_data = Column(JSONDocument)  # program details (JSON)
     formatted_program = Column(Text, nullable=True)  # Отформатированный текст программы для просмотра
     is_completed = Column(Boolean, default=False)
     is_paid = Column(Boolean, default=False)  # Оплачена ли программа
@@ -73,6 +82,11 @@ class TrainingProgram(Base):
     client = relationship("Client", back_populates="programs")
     progress_entries = relationship("ProgressJournal", back_populates="program", foreign_keys="[ProgressJournal.program_id]")
 
+    __table_args__ = (
+        # Программы клиента (с фильтром по оплате), новые сверху
+        Index("ix_training_programs_client_paid_created", "client_id", "is_paid", "created_at"),
+    )
+
 
 class ProgramVersion(Base):
     """Snapshot of a training program for versioning and restore."""
@@ -80,7 +94,7 @@ class ProgramVersion(Base):
 
     id = Column(Integer, primary_key=True)
     program_id = Column(Integer, ForeignKey("training_programs.id"), nullable=False, index=True)
-    program_data = Column(Text, nullable=True)  # JSON string snapshot
+    program_data = Column(JSONDocument, nullable=True)  # JSON snapshot
     formatted_program = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -107,6 +121,13 @@ class Payment(Base):
     # Relationships
     client = relationship("Client", back_populates="payments")
 
+    __table_args__ = (
+        # Аналитика выручки: status = 'completed' AND completed_at >= ...
+        Index("ix_payments_status_completed_at", "status", "completed_at"),
+        # Платежи клиента, новые сверху
+        Index("ix_payments_client_created", "client_id", "created_at"),
+    )
+
 
 class PaymentWebhookLog(Base):
     """Stores recent webhook notifications from payment providers."""
@@ -115,9 +136,24 @@ class PaymentWebhookLog(Base):
     id = Column(Integer, primary_key=True)
     provider = Column(String(50), nullable=False)  # yookassa | tinkoff
     event = Column(String(100), nullable=True)     # event name or status
-    raw_payload = Column(Text, nullable=True)      # full JSON string
+    raw_payload = Column(Text, nullable=True)      # request body as received (JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Журнал вебхуков, новые сверху
+        Index("ix_payment_webhook_logs_created", "created_at"),
+    )
+
+
+class WebhookIdempotency(Base):
+    """Payment provider events that were already applied (retried notifications are skipped)."""
+    __tablename__ = "webhook_idempotency"
+
+    id = Column(Integer, primary_key=True)
+    provider = Column(String(50), nullable=False)  # yookassa | tinkoff
+    external_event_id = Column(String(255), nullable=False, unique=True)  # provider:payment:event
+    processed_at = Column(DateTime, default=datetime.utcnow)
+
 
 class Lead(Base):
     """Lead model - stores information about potential clients."""
@@ -159,4 +195,9 @@ class WebsiteSettings(Base):
     category = Column(String(50), nullable=True)  # general, header, footer, colors, fonts, widget, etc.
     description = Column(Text, nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    updated_by = Column(Integer, ForeignKey("users.id"), nullable=True)
\ No newline at end of file
+    updated_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    __table_args__ = (
+        # Настройки раздела (category = 'payments' и т.п.)
+        Index("ix_website_settings_category_key", "category", "setting_key"),
+    )
\ No newline at end of file
@@ -1,11 +1,11 @@
 """CRM-specific database models for fitness trainer system."""
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Index, Enum as SQLEnum, and_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 
-from database.models import Base
+from database.models import Base, JSONDocument
 
 
 class PipelineStage(Base):
@@ -26,6 +26,11 @@ class PipelineStage(Base):
     client_pipelines = relationship("ClientPipeline", back_populates="stage")
     pipeline = relationship("SalesPipeline", back_populates="stages")
 
+    __table_args__ = (
+        # Активные этапы по порядку (список этапов воронки)
+        Index("ix_pipeline_stages_active_order", "is_active", "order"),
+    )
+
 
 class ClientPipeline(Base):
     """Client pipeline tracking - tracks client movement through sales funnel."""
@@ -46,6 +51,11 @@ class ClientPipeline(Base):
     moved_by_user = relationship("User", foreign_keys="[ClientPipeline.moved_by]")
     pipeline = relationship("SalesPipeline", back_populates="client_entries")
 
+    __table_args__ = (
+        # История перемещений клиента, новые сверху
+        Index("ix_client_pipelines_client_moved", "client_id", "moved_at"),
+    )
+
 
 class ClientBotLink(Base):
     """Mapping tokens to clients for Telegram deep links."""
@@ -93,6 +103,11 @@ class ClientAction(Base):
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Действия клиента по типу (конверсии кампаний: payment_received)
+        Index("ix_client_action_client_type", "client_id", "action_type"),
+    )
+
     # Relationships
     client = relationship("Client", back_populates="actions", foreign_keys="[ClientAction.client_id]")
     creator = relationship("User", foreign_keys="[ClientAction.created_by]")
@@ -125,6 +140,11 @@ class ClientContact(Base):
     direction = Column(String(20), nullable=False)  # ContactDirection enum as string
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Лента контактов клиента, новые сверху
+        Index("ix_contacts_client_created", "client_id", "created_at"),
+    )
+
     # Relationships
     client = relationship("Client", back_populates="contacts", foreign_keys="[ClientContact.client_id]")
 
@@ -218,6 +238,7 @@ class Reminder(Base):
     sent_at = Column(DateTime, nullable=True)  # Когда было отправлено
     is_sent = Column(Boolean, default=False)  # Отправлено ли напоминание
     message_text = Column(Text, nullable=True)  # Текст напоминания
+    priority = Column(Integer, nullable=False, default=0)  # Чем больше, тем раньше отправляется
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -295,7 +316,7 @@ class MarketingCampaign(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     updated_by = Column(Integer, ForeignKey("users.id"), nullable=True)
-    params = Column(Text, nullable=True)  # JSON: throttling, UTM, etc.
+    params = Column(JSONDocument, nullable=True)  # throttling, UTM, etc.
 
 class CampaignAudience(Base):
     """Segment definition used by campaigns."""
@@ -304,7 +325,7 @@ class CampaignAudience(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(120), nullable=False)
     description = Column(Text, nullable=True)
-    filter_json = Column(Text, nullable=True)  # JSON DSL for selecting clients
+    filter_json = Column(JSONDocument, nullable=True)  # JSON DSL for selecting clients
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -336,12 +357,21 @@ class CampaignRun(Base):
     errors = Column(Integer, default=0)
     meta = Column(Text, nullable=True)  # JSON metrics, logs brief
 
+    __table_args__ = (
+        # Запуски кампании, последние сверху
+        Index("ix_campaign_run_campaign_started", "campaign_id", "started_at"),
+    )
+
 class ClientChannelPreference(Base):
     """Client-level channel preferences for marketing."""
     __tablename__ = "client_channel_preferences"
+    __table_args__ = (
+        # Одна запись на клиента (upsert по client_id)
+        Index("ux_client_channel_pref_client", "client_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
-    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     allow_telegram = Column(Boolean, default=True)
     allow_email = Column(Boolean, default=True)
     quiet_hours_start = Column(Integer, nullable=True)  # 0-23
@@ -360,6 +390,11 @@ class CampaignDelivery(Base):
     status = Column(String(20), default="sent")  # sent/failed/skipped
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Доставки кампании за период (summary/timeseries/список)
+        Index("ix_campaign_delivery_campaign_created", "campaign_id", "created_at"),
+    )
+
 class SocialPost(Base):
     """Scheduled social network posts."""
     __tablename__ = "social_posts"
@@ -426,7 +461,7 @@ class ProgramTemplate(Base):
     template_type = Column(String(50), nullable=False)  # 'footer' - разъяснения в конце PDF, 'program' - шаблон программы с плейсхолдерами
     content = Column(Text, nullable=False)  # Содержимое шаблона с плейсхолдерами
     description = Column(Text, nullable=True)  # Описание шаблона
-    placeholders = Column(Text, nullable=True)  # JSON массив доступных плейсхолдеров (например: ["{client_name}", "{trainer_name}"])
+    placeholders = Column(JSONDocument, nullable=True)  # JSON массив доступных плейсхолдеров (например: ["{client_name}", "{trainer_name}"])
     is_active = Column(Boolean, default=True)  # Активен ли шаблон
     is_default = Column(Boolean, default=False)  # Является ли шаблоном по умолчанию для своего типа
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -438,6 +473,19 @@ class ProgramTemplate(Base):
     creator = relationship("User", foreign_keys="[ProgramTemplate.created_by]")
     updater = relationship("User", foreign_keys="[ProgramTemplate.updated_by]")
 
+    __table_args__ = (
+        # Список шаблонов: фильтр по типу и активности, новые сверху
+        Index("ix_program_templates_type_active_created", "template_type", "is_active", "created_at"),
+        # Не больше одного активного шаблона по умолчанию на тип (частичный уникальный индекс)
+        Index(
+            "ux_program_templates_default",
+            "template_type",
+            unique=True,
+            postgresql_where=and_(is_default, is_active),
+            sqlite_where=and_(is_default, is_active),
+        ),
+    )
+
 
 class ProgramHistory(Base):
     """Program history model - stores archived programs that were sent to clients."""
@@ -447,7 +495,7 @@ class ProgramHistory(Base):
     original_program_id = Column(Integer, nullable=True)  # ID оригинальной программы (может быть удалена)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, index=True)
     program_type = Column(String(50))  # free_demo, paid_monthly, paid_3month
-    program_data = Column(Text)  # JSON string with program details
+    program_data = Column(JSONDocument)  # program details (JSON)
     formatted_program = Column(Text, nullable=True)  # Отформатированный текст программы
     sent_at = Column(DateTime, nullable=False)  # Когда была отправлена
     archived_at = Column(DateTime, default=datetime.utcnow)  # Когда была архивирована
@@ -467,8 +515,8 @@ class SalesPipeline(Base):
     name = Column(String(100), unique=True, nullable=False)
     description = Column(Text, nullable=True)
     is_enabled = Column(Boolean, default=True)
-    # JSON as text for simple storage of parameters/conditions (visibility rules, target segments, etc.)
-    params = Column(Text, nullable=True)
+    # Parameters/conditions as a JSON document (visibility rules, target segments, etc.)
+    params = Column(JSONDocument, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -5,6 +5,7 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from config import BCRYPT_ROUNDS
 from database.db import get_db_session
 from database.models_crm import User
 from loguru import logger
@@ -29,7 +30,7 @@ def reset_admin_password():
             return False
         
         # Hash new password
-        password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
         
         # Update password
         admin.password_hash = password_hash
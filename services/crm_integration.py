@@ -7,7 +7,6 @@ from database.models_crm import (
 )
 from loguru import logger
 from datetime import datetime
-import json
 
 
 class CRMIntegration:
@@ -189,7 +188,7 @@ class CRMIntegration:
             program = TrainingProgram(
                 client_id=client_id,
                 program_type=program_type,
-                program_data=json.dumps(program_data, ensure_ascii=False),
+                program_data=program_data,
                 formatted_program=formatted_program,
                 is_paid=True,
                 assigned_at=datetime.utcnow()
@@ -3,11 +3,26 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from loguru import logger
-import json
+import orjson
 from database.models_crm import FAQ
 from services.ai_service import ai_service
 
 
+def encode_keywords(keywords: Optional[List[str]]) -> Optional[str]:
+    """Serialize keywords for the FAQ.keywords text column (JSON array)."""
+    return orjson.dumps(keywords).decode() if keywords else None
+
+
+def decode_keywords(raw: Optional[str]) -> Optional[List[str]]:
+    """Parse FAQ.keywords; malformed or empty values give None."""
+    if not raw:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+
 class FAQService:
     """Service for managing FAQ and finding answers."""
     
@@ -55,15 +70,11 @@ class FAQService:
             for faq in all_faq:
                 score = 0
                 # Check keywords
-                if faq.keywords:
-                    try:
-                        keywords = json.loads(faq.keywords)
-                        if isinstance(keywords, list):
-                            for keyword in keywords:
-                                if keyword.lower() in query_words:
-                                    score += 2
-                    except:
-                        pass
+                keywords = decode_keywords(faq.keywords)
+                if isinstance(keywords, list):
+                    for keyword in keywords:
+                        if isinstance(keyword, str) and keyword.lower() in query_words:
+                            score += 2
                 
                 # Check question words
                 question_words = set(faq.question.lower().split())
@@ -155,7 +166,7 @@ class FAQService:
     @staticmethod
     def get_faq_by_id(db: Session, faq_id: int) -> Optional[FAQ]:
         """Get FAQ by ID."""
-        return db.query(FAQ).filter(FAQ.id == faq_id).first()
+        return db.get(FAQ, faq_id)
     
     @staticmethod
     def get_all_faq(
@@ -188,7 +199,7 @@ class FAQService:
             question=question,
             answer=answer,
             category=category,
-            keywords=json.dumps(keywords) if keywords else None,
+            keywords=encode_keywords(keywords),
             priority=priority,
             is_active=True,
             created_by=created_by
@@ -212,7 +223,7 @@ class FAQService:
         updated_by: Optional[int] = None
     ) -> Optional[FAQ]:
         """Update FAQ item."""
-        faq = db.query(FAQ).filter(FAQ.id == faq_id).first()
+        faq = db.get(FAQ, faq_id)
         if not faq:
             return None
         
@@ -223,7 +234,7 @@ class FAQService:
         if category is not None:
             faq.category = category
         if keywords is not None:
-            faq.keywords = json.dumps(keywords) if keywords else None
+            faq.keywords = encode_keywords(keywords)
         if priority is not None:
             faq.priority = priority
         if is_active is not None:
@@ -239,7 +250,7 @@ class FAQService:
     @staticmethod
     def delete_faq(db: Session, faq_id: int) -> bool:
         """Delete FAQ item."""
-        faq = db.query(FAQ).filter(FAQ.id == faq_id).first()
+        faq = db.get(FAQ, faq_id)
         if not faq:
             return False
         
@@ -1,14 +1,18 @@
 from __future__ import annotations
 from typing import Optional, Dict, Any, List
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from database.db import get_db_session
 from database.models import Client
 from database.models_crm import CampaignRun, CampaignMessage, CampaignAudience, ClientChannelPreference, CampaignDelivery
 from loguru import logger
-import json
 import os
 import requests
 from datetime import datetime
 
+# Delivery log rows are written in multi-row INSERTs of this size
+DELIVERY_BATCH_SIZE = 1000
+
 
 class MarketingService:
     @staticmethod
@@ -26,12 +30,8 @@ class MarketingService:
     @staticmethod
     def select_clients(db: Session, audience: Optional[CampaignAudience], limit: int = 100) -> List[Client]:
         q = db.query(Client)
-        filters: Dict[str, Any] = {}
-        if audience and audience.filter_json:
-            try:
-                filters = json.loads(audience.filter_json)
-            except Exception:
-                filters = {}
+        # filter_json is a JSON column, already decoded to a dict
+        filters: Dict[str, Any] = (audience.filter_json if audience else None) or {}
         # Simple filters: status, has_telegram, has_email
         status = filters.get("status")
         if status:
@@ -134,6 +134,20 @@ class MarketingService:
         run.total = len(clients); db.commit()
 
         sent = 0; errors = 0
+        deliveries: List[Dict[str, Any]] = []
+
+        def log_delivery(client_id: int, channel: str, ok: bool) -> None:
+            deliveries.append({
+                "run_id": run.id,
+                "campaign_id": run.campaign_id,
+                "client_id": client_id,
+                "channel": channel,
+                "status": "sent" if ok else "failed",
+            })
+            if len(deliveries) >= DELIVERY_BATCH_SIZE:
+                db.execute(insert(CampaignDelivery), deliveries)
+                deliveries.clear()
+
         for client in clients:
             text = MarketingService._render_message(msg.body_text, client)
             ok_any = False
@@ -158,29 +172,47 @@ class MarketingService:
             # telegram
             if MarketingService._respect_preferences(db, client, "telegram") and not recently_sent("telegram"):
                 ok_tg = MarketingService._send_telegram(client, text)
-                if ok_tg:
-                    db.add(CampaignDelivery(run_id=run.id, campaign_id=run.campaign_id, client_id=client.id, channel="telegram", status="sent"))
-                else:
-                    db.add(CampaignDelivery(run_id=run.id, campaign_id=run.campaign_id, client_id=client.id, channel="telegram", status="failed"))
+                log_delivery(client.id, "telegram", ok_tg)
                 ok_any = ok_tg or ok_any
             # email
             email = MarketingService._get_client_email(db, client)
             if email and MarketingService._respect_preferences(db, client, "email") and not recently_sent("email"):
                 ok_em = MarketingService._send_email(email, msg.title or "Сообщение", text)
-                if ok_em:
-                    db.add(CampaignDelivery(run_id=run.id, campaign_id=run.campaign_id, client_id=client.id, channel="email", status="sent"))
-                else:
-                    db.add(CampaignDelivery(run_id=run.id, campaign_id=run.campaign_id, client_id=client.id, channel="email", status="failed"))
+                log_delivery(client.id, "email", ok_em)
                 ok_any = ok_em or ok_any
             if ok_any:
                 sent += 1
             else:
                 errors += 1
+        if deliveries:
+            db.execute(insert(CampaignDelivery), deliveries)
         run.sent = sent; run.errors = errors
         db.commit()
         logger.info(f"Campaign run {run.id} sent={sent} errors={errors}")
         return len(clients)
 
+    @staticmethod
+    def process_queued_run(run_id: int, limit: int = 100) -> None:
+        """Process a run created by the API; runs after the response, in its own session."""
+        db = get_db_session()
+        try:
+            run = db.get(CampaignRun, run_id)
+            if not run:
+                logger.warning(f"Campaign run {run_id} not found")
+                return
+            run.status = "running"; db.commit()
+            try:
+                MarketingService.process_run(db, run, limit=limit)
+                run.status = "completed"
+            except Exception as e:
+                logger.exception(f"Campaign run {run_id} failed: {e}")
+                db.rollback()
+                run.status = "failed"
+            run.completed_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
     @staticmethod
     def _start_run(db: Session, campaign_id: int, audience_id: Optional[int], limit: int = 100) -> Optional[int]:
         run = CampaignRun(campaign_id=campaign_id, audience_id=audience_id, status="running", started_at=datetime.utcnow())
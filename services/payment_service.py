@@ -2,12 +2,13 @@
 import json
 import asyncio
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from loguru import logger
 
 from database.db import get_db_session
-from database.models import Payment, Client, TrainingProgram
+from database.models import Payment, Client, TrainingProgram, WebhookIdempotency
 from database.models_crm import ClientAction, ActionType, PipelineStage, PromoCode, PromoUsage
 from services.payments_yookassa import get_yookassa_payment_status, parse_yookassa_status
 from services.pipeline_service import PipelineAutomation
@@ -15,9 +16,29 @@ from config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
 from services.program_delivery import deliver_program_to_client
 
 
+class DuplicateWebhookEvent(Exception):
+    """The webhook event was already processed."""
+
+
 class PaymentService:
     """Service for checking payment status and updating pipeline."""
     
+    @staticmethod
+    def _claim_webhook_event(db: Session, provider: str, event_key: str) -> None:
+        """
+        Record a webhook event in the current transaction, so it commits together with its effects.
+        
+        Must be called before any other change in the session: on a duplicate the session
+        is rolled back and DuplicateWebhookEvent is raised.
+        """
+        db.add(WebhookIdempotency(provider=provider, external_event_id=event_key))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            logger.info(f"Webhook event {event_key} already processed, skipping")
+            raise DuplicateWebhookEvent(event_key)
+    
     @staticmethod
     def check_payment_status(payment: Payment) -> bool:
         """
@@ -154,6 +175,21 @@ class PaymentService:
             db.rollback()
             raise
     
+    @staticmethod
+    def handle_payment_completed_by_id(payment_id: int) -> None:
+        """Run the completed-payment side effects in a session of their own (background tasks)."""
+        db = get_db_session()
+        try:
+            payment = db.get(Payment, payment_id)
+            if not payment:
+                logger.warning(f"Payment {payment_id} not found for completion handling")
+                return
+            PaymentService._handle_payment_completed(db, payment)
+        except Exception as e:
+            logger.exception(f"Error in completion handling for payment {payment_id}: {e}")
+        finally:
+            db.close()
+    
     @staticmethod
     async def check_pending_payments_async(limit: int = 100) -> int:
         """
@@ -281,7 +317,7 @@ class PaymentService:
                 program = TrainingProgram(
                     client_id=client.id,
                     program_type=program_type,
-                    program_data=json.dumps(metadata["program_data"], ensure_ascii=False),
+                    program_data=metadata["program_data"],
                     formatted_program=metadata["formatted_program"],
                     is_paid=True,
                     assigned_at=datetime.utcnow(),
@@ -313,7 +349,67 @@ class PaymentService:
             db.close()
 
     @staticmethod
-    def update_payment_from_webhook(payment_id: str, status: str, metadata: Optional[dict] = None) -> bool:
+    def update_payment_from_tinkoff_webhook(
+        order_id: str,
+        payment_id: Optional[str],
+        status: str,
+        event_key: Optional[str] = None,
+        on_completed: Optional[Callable[[int], None]] = None,
+    ) -> bool:
+        """
+        Update payment status from Tinkoff notification.
+        
+        Args:
+            order_id: OrderId of the notification (internal payment ID)
+            payment_id: Tinkoff PaymentId (stored as the external payment ID)
+            status: Internal status (already mapped with parse_tinkoff_status)
+            event_key: Idempotency key of the notification; a retried event is not applied twice
+            on_completed: If given, called with the payment id after the status commit instead of
+                running the completed-payment side effects inline (e.g. to queue a background task)
+            
+        Returns:
+            True if payment was updated, False if it was not found
+            
+        Raises:
+            DuplicateWebhookEvent: the event with this key was already processed
+        """
+        db = get_db_session()
+        try:
+            if event_key:
+                PaymentService._claim_webhook_event(db, "tinkoff", event_key)
+            payment = db.get(Payment, int(order_id))
+            if not payment:
+                logger.warning(f"Tinkoff webhook: payment {order_id} not found")
+                return False
+            old_status = payment.status
+            payment.payment_id = payment_id or payment.payment_id
+            payment.status = status
+            newly_completed = status == "completed" and old_status != "completed"
+            if newly_completed:
+                payment.completed_at = datetime.utcnow()
+                if on_completed is None:
+                    PaymentService._handle_payment_completed(db, payment)
+            db.commit()
+            if newly_completed and on_completed is not None:
+                on_completed(payment.id)
+            return True
+        except DuplicateWebhookEvent:
+            raise
+        except Exception:
+            # Logged by the webhook handler, which answers with an error status
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def update_payment_from_webhook(
+        payment_id: str,
+        status: str,
+        metadata: Optional[dict] = None,
+        event_key: Optional[str] = None,
+        on_completed: Optional[Callable[[int], None]] = None,
+    ) -> bool:
         """
         Update payment status from YooKassa webhook.
         
@@ -321,12 +417,20 @@ class PaymentService:
             payment_id: YooKassa payment ID
             status: Payment status from YooKassa
             metadata: Optional metadata from webhook
+            event_key: Idempotency key of the notification; a retried event is not applied twice
+            on_completed: If given, called with the payment id after the status commit instead of
+                running the completed-payment side effects inline (e.g. to queue a background task)
             
         Returns:
             True if payment was updated
+            
+        Raises:
+            DuplicateWebhookEvent: the event with this key was already processed
         """
         db = get_db_session()
         try:
+            if event_key:
+                PaymentService._claim_webhook_event(db, "yookassa", event_key)
             payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
             if not payment:
                 logger.warning(f"Payment with YooKassa ID {payment_id} not found")
@@ -358,18 +462,25 @@ class PaymentService:
                 merged_meta.update(metadata)
                 payment.payment_metadata = json.dumps(merged_meta, ensure_ascii=False)
             
-            if internal_status == "completed" and old_status != "completed":
+            newly_completed = internal_status == "completed" and old_status != "completed"
+            if newly_completed:
                 payment.completed_at = datetime.utcnow()
-                PaymentService._handle_payment_completed(db, payment)
+                if on_completed is None:
+                    PaymentService._handle_payment_completed(db, payment)
             elif internal_status == "failed":
                 logger.info(f"Payment {payment.id} failed via webhook")
             
             db.commit()
             logger.info(f"Payment {payment.id} updated from webhook: {old_status} → {internal_status}")
-            if internal_status == "completed":
+            if newly_completed and on_completed is not None:
+                # The deferred handler schedules the post-payment workflow itself
+                on_completed(payment.id)
+            elif internal_status == "completed":
                 PaymentService._schedule_post_payment_workflow(payment.id, payment.payment_metadata)
             return True
             
+        except DuplicateWebhookEvent:
+            raise
         except Exception as e:
             logger.error(f"Error updating payment from webhook: {e}")
             db.rollback()
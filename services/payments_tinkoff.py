@@ -78,15 +78,17 @@ async def create_tinkoff_payment(
             }
 
 
+# Tinkoff status -> internal status (anything else is still pending)
+_TINKOFF_STATUS_MAP = {
+    "authorized": "pending",
+    "confirmed": "completed",
+    "rejected": "failed",
+    "canceled": "failed",
+}
+
+
 def parse_tinkoff_status(status: str) -> str:
-    status = (status or "").lower()
-    mapping = {
-        "authorized": "pending",
-        "confirmed": "completed",
-        "rejected": "failed",
-        "canceled": "failed",
-    }
-    return mapping.get(status, "pending")
+    return _TINKOFF_STATUS_MAP.get((status or "").lower(), "pending")
 
 
 def verify_tinkoff_token(payload: Dict[str, Any], secret: Optional[str] = None) -> bool:
@@ -121,6 +121,15 @@ async def get_yookassa_payment_status(payment_id: str) -> Dict[str, Any]:
             return data
 
 
+# YooKassa status -> internal status (anything else is still pending)
+_YOOKASSA_STATUS_MAP = {
+    "pending": "pending",
+    "waiting_for_capture": "pending",
+    "succeeded": "completed",
+    "canceled": "failed",
+}
+
+
 def parse_yookassa_status(yookassa_status: str) -> str:
     """Parse YooKassa payment status to internal status.
     
@@ -130,11 +139,5 @@ def parse_yookassa_status(yookassa_status: str) -> str:
     Returns:
         Internal status (pending, completed, failed)
     """
-    status_map = {
-        "pending": "pending",
-        "waiting_for_capture": "pending",
-        "succeeded": "completed",
-        "canceled": "failed",
-    }
-    return status_map.get(yookassa_status, "pending")
+    return _YOOKASSA_STATUS_MAP.get(yookassa_status, "pending")
 
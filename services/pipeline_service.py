@@ -107,7 +107,7 @@ class PipelineAutomation:
         if not stage_id:
             return None
         if stage_id not in self._stages_by_id:
-            stage = self.db.query(PipelineStage).filter(PipelineStage.id == stage_id).first()
+            stage = self.db.get(PipelineStage, stage_id)
             if stage:
                 self._stages_by_id[stage_id] = stage
                 self._stages_by_name[stage.name] = stage
@@ -4,7 +4,6 @@ from database.models import TrainingProgram, Client
 from typing import Optional, Dict, Any
 from loguru import logger
 from datetime import datetime
-import json
 
 
 class ProgramStorage:
@@ -54,7 +53,7 @@ class ProgramStorage:
             program = TrainingProgram(
                 client_id=client_id,
                 program_type=program_type,
-                program_data=json.dumps(program_data, ensure_ascii=False),
+                program_data=program_data,
                 formatted_program=formatted_program,
                 is_paid=(program_type in ["paid_monthly", "paid_3month", "paid_offline"]),
                 assigned_at=datetime.utcnow()
@@ -107,7 +106,7 @@ class ProgramStorage:
         try:
             program = db.query(TrainingProgram).filter(TrainingProgram.id == program_id).first()
             if program:
-                return json.loads(program.program_data)
+                return program.program_data
             return None
         except Exception as e:
             logger.error(f"Error getting program: {e}")
@@ -132,21 +131,17 @@ class ProgramStorage:
                 TrainingProgram.client_id == client_id
             ).order_by(TrainingProgram.created_at.desc()).all()
             
-            result = []
-            for program in programs:
-                try:
-                    data = json.loads(program.program_data)
-                    result.append({
-                        "id": program.id,
-                        "type": program.program_type,
-                        "data": data,
-                        "created_at": program.created_at.isoformat(),
-                        "is_completed": program.is_completed
-                    })
-                except:
-                    continue
-            
-            return result
+            # program_data is decoded by the column type; nothing left to fail per row
+            return [
+                {
+                    "id": program.id,
+                    "type": program.program_type,
+                    "data": program.program_data,
+                    "created_at": program.created_at.isoformat() if program.created_at else "",
+                    "is_completed": program.is_completed
+                }
+                for program in programs
+            ]
         except Exception as e:
             logger.error(f"Error getting client programs: {e}")
             return []
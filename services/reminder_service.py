@@ -1,10 +1,11 @@
 """Service for managing automated reminders for clients."""
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
+from sqlalchemy import func, literal, select, Select
 from sqlalchemy.orm import Session
 from loguru import logger
 
-from database.db import get_db_session
+from database.db import get_db_session, engine
 from database.models import Client, TrainingProgram
 from database.models_crm import Reminder, ReminderType
 from services.pipeline_service import PipelineAutomation
@@ -12,6 +13,41 @@ from services.crm_integration import CRMIntegration
 from config import PRICE_ONLINE_1_MONTH, PRICE_ONLINE_3_MONTHS, TRAINER_NAME, TRAINER_TELEGRAM, TRAINER_PHONE
 
 
+# Базовый приоритет по типу напоминания (по умолчанию 0)
+REMINDER_PRIORITY: Dict[str, int] = {
+    ReminderType.FREE_PROGRAM_DAY_7.value: 2,  # предложение оплаты
+    ReminderType.PAYMENT_REMINDER.value: 2,
+}
+
+# Старение: каждые N часов просрочки добавляют +1 к приоритету,
+# чтобы при накопившейся очереди низкоприоритетные напоминания не голодали
+REMINDER_AGING_HOURS = 12
+
+
+def _hours_since(column, now: datetime):
+    """SQL expression: hours elapsed from `column` to `now`."""
+    if engine.dialect.name == "sqlite":
+        return (func.julianday(literal(now)) - func.julianday(column)) * 24
+    return func.extract("epoch", literal(now) - column) / 3600
+
+
+def due_reminders_query(limit: int = 100, now: Optional[datetime] = None) -> Select:
+    """
+    Select due reminders, most urgent first.
+
+    Order by effective priority = priority + hours overdue / REMINDER_AGING_HOURS,
+    then by scheduled time.
+    """
+    now = now or datetime.utcnow()
+    effective_priority = Reminder.priority + _hours_since(Reminder.scheduled_at, now) / REMINDER_AGING_HOURS
+    return (
+        select(Reminder)
+        .where(Reminder.is_sent == False, Reminder.scheduled_at <= now)
+        .order_by(effective_priority.desc(), Reminder.scheduled_at)
+        .limit(limit)
+    )
+
+
 class ReminderService:
     """Service for creating and sending reminders to clients."""
     
@@ -36,6 +72,7 @@ class ReminderService:
                 client_id=client_id,
                 program_id=program_id,
                 reminder_type=ReminderType.FREE_PROGRAM_DAY_3.value,
+                priority=REMINDER_PRIORITY.get(ReminderType.FREE_PROGRAM_DAY_3.value, 0),
                 scheduled_at=program_assigned_at + timedelta(days=3),
                 message_text=get_reminder_message(ReminderType.FREE_PROGRAM_DAY_3.value)
             )
@@ -47,6 +84,7 @@ class ReminderService:
                 client_id=client_id,
                 program_id=program_id,
                 reminder_type=ReminderType.FREE_PROGRAM_DAY_5.value,
+                priority=REMINDER_PRIORITY.get(ReminderType.FREE_PROGRAM_DAY_5.value, 0),
                 scheduled_at=program_assigned_at + timedelta(days=5),
                 message_text=get_reminder_message(ReminderType.FREE_PROGRAM_DAY_5.value)
             )
@@ -58,6 +96,7 @@ class ReminderService:
                 client_id=client_id,
                 program_id=program_id,
                 reminder_type=ReminderType.FREE_PROGRAM_DAY_7.value,
+                priority=REMINDER_PRIORITY.get(ReminderType.FREE_PROGRAM_DAY_7.value, 0),
                 scheduled_at=program_assigned_at + timedelta(days=7),
                 message_text=get_reminder_message(ReminderType.FREE_PROGRAM_DAY_7.value)
             )
@@ -81,7 +120,7 @@ class ReminderService:
     @staticmethod
     def get_due_reminders(limit: int = 100) -> List[Reminder]:
         """
-        Get reminders that are due to be sent.
+        Get reminders that are due to be sent, highest effective priority first.
         
         Args:
             limit: Maximum number of reminders to return
@@ -91,11 +130,7 @@ class ReminderService:
         """
         db = get_db_session()
         try:
-            now = datetime.utcnow()
-            reminders = db.query(Reminder).filter(
-                Reminder.is_sent == False,
-                Reminder.scheduled_at <= now
-            ).limit(limit).all()
+            reminders = db.scalars(due_reminders_query(limit=limit)).all()
             return reminders
         except Exception as e:
             logger.error(f"Error getting due reminders: {e}")
@@ -242,21 +277,23 @@ def get_reminder_message(reminder_type: str) -> str:
     return messages.get(reminder_type, "Напоминание от фитнес-тренера.")
 
 
-async def send_reminder_via_bot(reminder: Reminder, bot) -> bool:
+async def send_reminder_via_bot(reminder: Reminder, bot, client: Optional[Client] = None) -> bool:
     """
     Send reminder message via Telegram bot.
     
     Args:
         reminder: Reminder to send
         bot: Telegram bot instance
+        client: Already loaded reminder client (skips the lookup query)
         
     Returns:
         True if successful
     """
     db = None
     try:
-        db = get_db_session()
-        client = db.query(Client).filter(Client.id == reminder.client_id).first()
+        if client is None:
+            db = get_db_session()
+            client = db.query(Client).filter(Client.id == reminder.client_id).first()
         if not client or client.telegram_id <= 0:
             return False
         
@@ -0,0 +1,84 @@
+"""Short-lived cache for read-mostly CRM API responses."""
+import time
+from typing import Any, Optional
+
+import orjson
+from loguru import logger
+
+from config import REDIS_URL
+
+_redis = None
+
+# Without Redis every worker process has its own copy and clear() only reaches the process
+# that handled the write: entries then live this long at most, whatever the namespace TTL
+MEMORY_CACHE_TTL_SECONDS = 5
+
+
+def _get_redis():
+    """Shared Redis client when REDIS_URL is set (cache is then common to all API replicas)."""
+    global _redis
+    if _redis is None and REDIS_URL:
+        from redis.asyncio import Redis
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+class ResponseCache:
+    """
+    JSON-serializable values cached per key for `ttl` seconds within a namespace.
+
+    Stored in Redis when REDIS_URL is set, in process memory otherwise (capped at
+    MEMORY_CACHE_TTL_SECONDS, since other workers do not see clear()). Write endpoints
+    call clear() so changes are visible immediately; the TTL only bounds staleness
+    for writes made elsewhere. Redis errors are logged and treated as a cache miss.
+    """
+
+    def __init__(self, namespace: str, ttl: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory: dict[str, tuple[float, Any]] = {}
+
+    def _redis_key(self, key: str) -> str:
+        return f"crm-cache:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        redis = _get_redis()
+        if redis is None:
+            cached = self._memory.get(key)
+            if cached is None or cached[0] <= time.monotonic():
+                return None
+            return cached[1]
+        try:
+            raw = await redis.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"Response cache {self.namespace}: read failed: {e}")
+            return None
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any) -> None:
+        redis = _get_redis()
+        if redis is None:
+            self._memory[key] = (time.monotonic() + min(self.ttl, MEMORY_CACHE_TTL_SECONDS), value)
+            return
+        try:
+            await redis.set(self._redis_key(key), orjson.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Response cache {self.namespace}: write failed: {e}")
+
+    async def clear(self) -> None:
+        """Drop every cached entry of the namespace."""
+        self._memory.clear()
+        redis = _get_redis()
+        if redis is None:
+            return
+        try:
+            keys = [key async for key in redis.scan_iter(match=self._redis_key("*"))]
+            if keys:
+                await redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Response cache {self.namespace}: clear failed: {e}")
+
+
+# Pipeline list (dashboard) and default template per type (every program render)
+pipelines_cache = ResponseCache("pipelines", ttl=300)
+default_template_cache = ResponseCache("default_template", ttl=3600)
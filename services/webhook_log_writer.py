@@ -0,0 +1,88 @@
+"""Batched writes of payment webhook logs."""
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import insert
+
+from database.db import AsyncSessionLocal
+from database.models import PaymentWebhookLog
+
+# A batch is written when it is full or this many seconds after its first row
+WEBHOOK_LOG_BATCH_SIZE = 200
+WEBHOOK_LOG_BATCH_DELAY = 0.5
+
+
+class WebhookLogBatcher:
+    """Collects webhook log rows and inserts them with one transaction per batch."""
+
+    def __init__(self, max_batch_size: int = WEBHOOK_LOG_BATCH_SIZE, max_delay: float = WEBHOOK_LOG_BATCH_DELAY):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, provider: str, event: Optional[str], raw_payload: Optional[str]) -> None:
+        """Queue a log row (must be called from the event loop); the worker starts on first use."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._queue.put_nowait({
+            "provider": provider,
+            "event": event,
+            "raw_payload": raw_payload,
+            # Time of arrival, not of the batch insert
+            "created_at": datetime.utcnow(),
+        })
+
+    async def stop(self) -> None:
+        """Stop the worker and write the rows still queued (application shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is None:
+            return
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._queue = None
+        if pending:
+            await self._write(pending)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Stopped while collecting: rows already taken from the queue are still written
+                await self._write(batch)
+                raise
+            await asyncio.shield(self._write(batch))
+
+    async def _write(self, batch: list[dict]) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(PaymentWebhookLog), batch)
+                await db.commit()
+        except Exception as e:
+            # Logs are an audit trail only: a failed batch must not affect webhook handling
+            logger.error(f"Error writing {len(batch)} webhook logs: {e}")
+
+
+webhook_log_batcher = WebhookLogBatcher()